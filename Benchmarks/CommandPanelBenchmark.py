@@ -0,0 +1,567 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Benchmarks.
+
+Headless benchmarks for panel construction, run under the offscreen Qt
+platform with FreeCAD stand-ins (CommandPanelStandIns). Every scenario
+is run for each size (number of actions, menus and buttons):
+
+    actionList          Full scan of the main window actions.
+    findGroup           Menu group lookup with index rebuild.
+    findGroupWarm       Menu group lookup with known index.
+    workbenchButtons    Buttons of the workbench default menu.
+    onWorkbench         Workbench activation without cached panel.
+    workbenchSwitch     Switch between two workbenches with cached panels.
+    flowLayout          Flow layout pass without cached item metrics.
+    preferences         Preferences dialog creation and populate.
+    search              Search index rebuild and query.
+
+Reported are wall time (best and median of repeats), memory allocated
+(peak and net, tracemalloc), QObjects created and QObjects left after
+cleanup, and parameter reads and writes. Results can be saved as a
+baseline, together with the repeat count, and compared with it. Wall
+time is compared by median with a wider tolerance, time and memory
+differences below absolute floors are ignored. Startup import time and
+modules imported at startup are checked in a separate interpreter.
+
+    python Benchmarks/CommandPanelBenchmark.py --sizes 10,100,1000
+    python Benchmarks/CommandPanelBenchmark.py --save baseline.json
+    python Benchmarks/CommandPanelBenchmark.py --compare baseline.json
+
+Exit status is 1 on regression."""
+
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import subprocess
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import CommandPanelStandIns as standins
+from CommandPanelChecks import DEFERRED
+from CommandPanelChecks import IMPORT_BUDGET
+from CommandPanelChecks import application
+from CommandPanelChecks import startupModules
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+
+SIZES = [10, 100, 1000, 10000]
+# Time differences below the floor (milliseconds) are noise
+TIME_FLOOR = 1.0
+# Memory differences below the floor (KiB) are noise
+MEMORY_FLOOR = 32.0
+# Repeats of the timed run, if not given and not in the baseline
+REPEAT = 5
+
+scenarios = OrderedDict()
+workbenches = [0]
+
+
+def scenario(name):
+    """Register scenario class."""
+    def register(cls):
+        scenarios[name] = cls
+        return cls
+    return register
+
+
+def flush():
+    """Delete objects scheduled with deleteLater."""
+    from PySide import QtCore
+    QtCore.QCoreApplication.sendPostedEvents(None,
+                                             QtCore.QEvent.DeferredDelete)
+    gc.collect()
+
+
+def qobjects():
+    """Number of widgets and main window child objects."""
+    from PySide import QtGui
+    from PySide import QtCore
+    widgets = len(QtGui.QApplication.allWidgets())
+    mw = standins.getMainWindow()
+    other = [o for o in mw.findChildren(QtCore.QObject)
+             if not o.isWidgetType()]
+    return widgets + len(other)
+
+
+def workbenchName(prefix):
+    """Unique workbench name. Parameter observers are attached once per
+       group, so every scenario uses new workbench groups."""
+    workbenches[0] += 1
+    name = prefix + str(workbenches[0]) + "Workbench"
+    standins.addWorkbench(name, prefix + " " + str(workbenches[0]))
+    return name
+
+
+class World(object):
+    """Actions, menus and workbench default menu for the size."""
+    def __init__(self, size, menus=True):
+        from PySide import QtGui
+        from PySide import QtCore
+        import CommandPanel as cp
+        import CommandPanelCommon as cpc
+        self.size = size
+        self.workbench = workbenchName("Bench")
+        self.holder = QtCore.QObject(standins.getMainWindow())
+        self.names = []
+        for i in range(size):
+            a = QtGui.QAction(self.holder)
+            a.setObjectName("Bench_Command" + str(i))
+            a.setText("Bench command " + str(i))
+            a.setToolTip("Benchmark command number " + str(i))
+            self.names.append(a.objectName())
+        cpc.invalidateActions()
+        definitions = []
+        if menus:
+            for i in range(size):
+                definitions.append({
+                    "workbench": self.workbench,
+                    "uuid": "Menu" + str(i),
+                    "name": "Menu " + str(i),
+                    "commands": self.names[i:i + 3]})
+        definitions.append({
+            "workbench": self.workbench,
+            "uuid": "Default",
+            "name": "Default",
+            "default": True,
+            "commands": self.names})
+        self.domains = cp.addMenus(definitions)
+        standins.activateWorkbench(self.workbench)
+
+    def close(self):
+        """Remove actions and menu groups of the world, later scenarios
+           read menus of all workbench groups."""
+        import CommandPanelCommon as cpc
+        self.holder.setParent(None)
+        self.holder.deleteLater()
+        self.holder = None
+        cpc.p.GetGroup("System").RemGroup(self.workbench)
+        cpc.invalidateIndex("System", self.workbench)
+        cpc.invalidateActions()
+        flush()
+
+
+class Scenario(object):
+    """Benchmark scenario. Setup and teardown are not measured, cleanup
+       after every run is not measured."""
+    def __init__(self, size):
+        self.size = size
+        self.world = None
+
+    def setup(self):
+        self.world = World(self.size)
+
+    def run(self):
+        pass
+
+    def cleanup(self):
+        pass
+
+    def teardown(self):
+        if self.world:
+            self.world.close()
+
+
+@scenario("actionList")
+class ActionList(Scenario):
+    def setup(self):
+        self.world = World(self.size, menus=False)
+
+    def run(self):
+        import CommandPanelCommon as cpc
+        cpc.invalidateActions()
+        cpc.actionList()
+
+
+@scenario("findGroup")
+class FindGroup(Scenario):
+    def run(self):
+        import CommandPanelCommon as cpc
+        cpc.invalidateIndex()
+        for domain in self.world.domains:
+            cpc.findGroup(domain)
+
+
+@scenario("findGroupWarm")
+class FindGroupWarm(Scenario):
+    def setup(self):
+        import CommandPanelCommon as cpc
+        super(FindGroupWarm, self).setup()
+        cpc.findGroup(self.world.domains[0])
+
+    def run(self):
+        import CommandPanelCommon as cpc
+        for domain in self.world.domains:
+            cpc.findGroup(domain)
+
+
+@scenario("workbenchButtons")
+class WorkbenchButtons(Scenario):
+    def setup(self):
+        self.world = World(self.size, menus=False)
+        self.buttons = []
+
+    def run(self):
+        import CommandPanelCommands as cpcmd
+        self.buttons = cpcmd.workbenchButtons(self.world.workbench)
+
+    def cleanup(self):
+        import CommandPanelCommands as cpcmd
+        cpcmd.clearList(list(self.buttons))
+        self.buttons = []
+        flush()
+
+
+@scenario("onWorkbench")
+class OnWorkbench(Scenario):
+    def setup(self):
+        self.world = World(self.size, menus=False)
+
+    def run(self):
+        import CommandPanelGui as cpg
+        import CommandPanelCache as cache
+        import CommandPanelPlan as plan
+        cache.invalidate()
+        plan.invalidate()
+        cpg.onWorkbench()
+
+    def cleanup(self):
+        import CommandPanelGui as cpg
+        import CommandPanelCache as cache
+        cache.invalidate()
+        if cpg.panel:
+            cpg.panel.discard()
+            cpg.panel = None
+        flush()
+
+
+@scenario("workbenchSwitch")
+class WorkbenchSwitch(OnWorkbench):
+    def setup(self):
+        import CommandPanelGui as cpg
+        self.world = World(self.size, menus=False)
+        self.other = World(self.size, menus=False)
+        for world in [self.world, self.other]:
+            standins.activateWorkbench(world.workbench)
+            cpg.onWorkbench()
+
+    def run(self):
+        import CommandPanelGui as cpg
+        for world in [self.world, self.other]:
+            standins.activateWorkbench(world.workbench)
+            cpg.onWorkbench()
+
+    def cleanup(self):
+        pass
+
+    def teardown(self):
+        super(WorkbenchSwitch, self).cleanup()
+        self.other.close()
+        super(WorkbenchSwitch, self).teardown()
+
+
+@scenario("flowLayout")
+class FlowLayout(Scenario):
+    def setup(self):
+        from PySide import QtGui
+        from PySide import QtCore
+        import CommandPanelFlowLayout as flow
+        self.widget = QtGui.QWidget()
+        self.layout = flow.FlowLayout()
+        self.layout.setSpaceXY()
+        self.widget.setLayout(self.layout)
+        for i in range(self.size):
+            btn = QtGui.QToolButton()
+            btn.setText("Button " + str(i))
+            self.layout.addWidget(btn)
+        self.rect = QtCore.QRect(0, 0, 300, 100)
+
+    def run(self):
+        self.layout.clearCache()
+        height = self.layout.heightForWidth(self.rect.width())
+        self.rect.setHeight(height)
+        self.layout.setGeometry(self.rect)
+
+    def teardown(self):
+        self.widget.deleteLater()
+        self.widget = None
+        self.layout = None
+        flush()
+
+
+@scenario("preferences")
+class Preferences(Scenario):
+    def setup(self):
+        self.world = World(self.size)
+        self.dialog = None
+
+    def run(self):
+        import CommandPanelPreferences as cpp
+        cpp.createWidgets()
+        self.dialog = cpp.dialog()
+
+    def cleanup(self):
+        self.dialog.deleteLater()
+        self.dialog = None
+        flush()
+
+
+@scenario("search")
+class Search(Scenario):
+    def run(self):
+        import CommandPanelSearch as search
+        search.invalidate()
+        search.search("bench 1", 30)
+
+
+def measure(cls, size, repeat):
+    """Run scenario and return the metrics."""
+    import CommandPanelCommon as cpc
+    bench = cls(size)
+    bench.setup()
+    try:
+        # Warm-up run, then timed runs without garbage collection
+        bench.run()
+        bench.cleanup()
+        times = []
+        gc.collect()
+        gc.disable()
+        try:
+            for i in range(repeat):
+                start = clock()
+                bench.run()
+                times.append((clock() - start) * 1000)
+                bench.cleanup()
+        finally:
+            gc.enable()
+        times.sort()
+
+        # Objects and parameter access
+        flush()
+        objects = qobjects()
+        standins.resetCounters()
+        bench.run()
+        reads = standins.counters["reads"]
+        writes = standins.counters["writes"]
+        created = qobjects() - objects
+        bench.cleanup()
+        flush()
+        leaked = qobjects() - objects
+
+        # Allocations
+        peak = None
+        net = None
+        if tracemalloc:
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            bench.run()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            net = round((current - before) / 1024.0, 1)
+            peak = round((peak - before) / 1024.0, 1)
+            bench.cleanup()
+    finally:
+        bench.teardown()
+        cpc.invalidateIndex()
+
+    return OrderedDict([("ms", round(times[0], 3)),
+                        ("median", round(times[len(times) // 2], 3)),
+                        ("peak_kib", peak),
+                        ("net_kib", net),
+                        ("qobjects", created),
+                        ("leaked", leaked),
+                        ("reads", reads),
+                        ("writes", writes)])
+
+
+def importProbe():
+    """Import the command panel the way InitGui does and print import
+       time and imported command panel modules as JSON."""
+    application()
+    start = clock()
+    import CommandPanelGui
+    import CommandPanelGlobalDefinitions
+    ms = (clock() - start) * 1000
+    modules = startupModules()
+    print(json.dumps({"ms": round(ms, 3), "modules": modules}))
+
+
+def startupImports():
+    """Import time and modules in a new interpreter."""
+    out = subprocess.check_output([sys.executable,
+                                   os.path.abspath(__file__),
+                                   "--import-probe"])
+    return json.loads(out.decode("UTF-8").strip().splitlines()[-1])
+
+
+def checkImports(result, baseline, budget):
+    """Startup import problems."""
+    problems = []
+    for m in DEFERRED:
+        if m in result["modules"]:
+            problems.append(m + " is imported at startup")
+    if result["ms"] > budget:
+        problems.append("startup import " + str(result["ms"]) +
+                        " ms exceeds budget " + str(budget) + " ms")
+    if baseline:
+        for m in result["modules"]:
+            if m not in baseline["modules"]:
+                problems.append(m + " is a new startup import")
+    return problems
+
+
+def regressions(results, baseline, tolerance, timeTolerance):
+    """Metrics worse than baseline. Wall time is compared by median
+       with its own tolerance, time and memory differences below the
+       floors are ignored."""
+    problems = []
+    for name in results:
+        for size in results[name]:
+            new = results[name][size]
+            old = baseline.get(name, {}).get(size)
+            if not old:
+                continue
+            if (new["median"] > old["median"] * timeTolerance and
+                    new["median"] - old["median"] > TIME_FLOOR):
+                problems.append((name, size, "median",
+                                 old["median"], new["median"]))
+            if (new["peak_kib"] is not None and
+                    old["peak_kib"] is not None and
+                    new["peak_kib"] > old["peak_kib"] * tolerance and
+                    new["peak_kib"] - old["peak_kib"] > MEMORY_FLOOR):
+                problems.append((name, size, "peak_kib",
+                                 old["peak_kib"], new["peak_kib"]))
+            for key in ["reads", "writes"]:
+                if new[key] > old[key] * tolerance:
+                    problems.append((name, size, key, old[key], new[key]))
+            for key in ["qobjects", "leaked"]:
+                if new[key] > old[key]:
+                    problems.append((name, size, key, old[key], new[key]))
+    return problems
+
+
+def report(name, size, metrics):
+    """Print scenario metrics."""
+    print("%-18s %6s %10.3f ms %10.3f ms %10s KiB %6s obj %6s leak "
+          "%7s rd %6s wr" % (name,
+                             size,
+                             metrics["ms"],
+                             metrics["median"],
+                             metrics["peak_kib"],
+                             metrics["qobjects"],
+                             metrics["leaked"],
+                             metrics["reads"],
+                             metrics["writes"]))
+
+
+def main(argv=None):
+    """Run benchmarks."""
+    parser = argparse.ArgumentParser(description="Command panel benchmarks")
+    parser.add_argument("--sizes",
+                        default=",".join([str(s) for s in SIZES]),
+                        help="comma separated sizes")
+    parser.add_argument("--scenarios",
+                        default=",".join(scenarios),
+                        help="comma separated scenario names")
+    parser.add_argument("--repeat", type=int,
+                        help="timed runs per scenario, by default the "
+                             "baseline repeat count or " + str(REPEAT))
+    parser.add_argument("--save", help="save results as baseline")
+    parser.add_argument("--compare", help="compare with baseline")
+    parser.add_argument("--tolerance", type=float, default=1.25,
+                        help="allowed ratio for memory and parameter "
+                             "access")
+    parser.add_argument("--time-tolerance", type=float, default=2.0,
+                        help="allowed ratio for median wall time, which "
+                             "varies more between runs")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--import-probe", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.import_probe:
+        importProbe()
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    repeat = max(args.repeat or baseline.get("repeat", REPEAT), 1)
+    if baseline.get("repeat", repeat) != repeat:
+        print("baseline repeat count is %d, running %d" %
+              (baseline["repeat"], repeat))
+
+    startup = startupImports()
+    print("startup import %.3f ms, %d modules" % (startup["ms"],
+                                                 len(startup["modules"])))
+
+    application()
+    import CommandPanelGui
+    import CommandPanelGlobalDefinitions
+
+    results = OrderedDict()
+    sizes = [s for s in args.sizes.split(",") if s]
+    for name in args.scenarios.split(","):
+        if name not in scenarios:
+            parser.error("unknown scenario " + name)
+        results[name] = OrderedDict()
+        for size in sizes:
+            metrics = measure(scenarios[name], int(size), repeat)
+            results[name][size] = metrics
+            report(name, size, metrics)
+
+    data = OrderedDict([("startup", startup),
+                        ("repeat", repeat),
+                        ("results", results)])
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(data, f, indent=2)
+
+    problems = checkImports(startup,
+                            baseline.get("startup"),
+                            args.import_budget)
+    for name, size, key, old, new in regressions(results,
+                                                 baseline.get("results", {}),
+                                                 args.tolerance,
+                                                 args.time_tolerance):
+        problems.append("%s %s: %s %s -> %s" % (name, size, key, old, new))
+    for problem in problems:
+        print("REGRESSION " + problem)
+
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
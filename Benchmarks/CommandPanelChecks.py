@@ -0,0 +1,894 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Checks.
+
+Behaviour checks run under the offscreen Qt platform with FreeCAD
+stand-ins (CommandPanelStandIns), no display is needed. Every check
+runs in its own interpreter, so module state of one check does not
+leak into another.
+
+    python Benchmarks/CommandPanelChecks.py             # All checks
+    python Benchmarks/CommandPanelChecks.py frequent    # Single check
+
+Exit status is 1 if any check fails."""
+
+
+import os
+import sys
+import time
+import subprocess
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import CommandPanelStandIns as standins
+
+
+checks = OrderedDict()
+
+# Modules imported at FreeCAD start (InitGui)
+STARTUP = ["CommandPanel",
+           "CommandPanelCache",
+           "CommandPanelCommands",
+           "CommandPanelCommon",
+           "CommandPanelEventFilter",
+           "CommandPanelFlowLayout",
+           "CommandPanelGlobalDefinitions",
+           "CommandPanelGui",
+           "CommandPanelIcons",
+           "CommandPanelObserver",
+           "CommandPanelPlan",
+           "CommandPanelSettings",
+           "CommandPanelTiming",
+           "CommandPanelToolbars",
+           "CommandPanelUsage",
+           "CommandPanelVirtual"]
+# Modules imported on first use
+DEFERRED = ["CommandPanelPreferences",
+            "CommandPanelPalette",
+            "CommandPanelModel",
+            "CommandPanelSearch"]
+# Startup import budget in milliseconds
+IMPORT_BUDGET = 500.0
+
+
+def check(name):
+    """Register check function."""
+    def register(fn):
+        checks[name] = fn
+        return fn
+    return register
+
+
+def application():
+    """Install stand-ins and create application and main window."""
+    standins.install()
+    from PySide import QtGui
+    app = QtGui.QApplication.instance() or QtGui.QApplication([])
+    standins.getMainWindow()
+    return app
+
+
+def addActions(names, parent=None):
+    """Add actions with the command names to the parent, main window by
+       default. Return dictionary of actions."""
+    from PySide import QtGui
+    actions = {}
+    for name in names:
+        a = QtGui.QAction(parent or standins.getMainWindow())
+        a.setObjectName(name)
+        a.setText(name.replace("_", " "))
+        actions[name] = a
+    return actions
+
+
+def removeAction(a):
+    """Remove the action from its parent and delete it."""
+    a.setParent(None)
+    a.deleteLater()
+    flush()
+
+
+def addWorkbench(name, commands, menus=None):
+    """Add workbench with the default menu and activate it. Return
+       domain of the default menu."""
+    import CommandPanel as cp
+    standins.addWorkbench(name)
+    default = {"workbench": name,
+               "uuid": "Default",
+               "name": "Default",
+               "default": True,
+               "commands": commands}
+    domains = cp.addMenus((menus or []) + [default])
+    standins.activateWorkbench(name)
+    return domains[-1]
+
+
+def flush():
+    """Deliver posted events, including deferred deletes."""
+    from PySide import QtCore
+    QtCore.QCoreApplication.sendPostedEvents(None, 0)
+    QtCore.QCoreApplication.sendPostedEvents(None,
+                                             QtCore.QEvent.DeferredDelete)
+
+
+def startupModules():
+    """Command panel modules imported by now."""
+    return sorted([m for m in sys.modules if m.startswith("CommandPanel")
+                   and m not in ["CommandPanelStandIns",
+                                 "CommandPanelChecks"]])
+
+
+def oldXpmLines(i):
+    """XPM parser replaced by xpmLines, one quoted string per line."""
+    lines = []
+    for a in i.split("{", 1)[1].rsplit("}", 1)[0].strip().split("\n"):
+        lines.append(a.split('"', 1)[1].rsplit('"', 1)[0])
+    return lines
+
+
+@check("imports")
+def checkImports():
+    """Startup imports stay within the module list and the budget."""
+    application()
+    try:
+        clock = time.perf_counter
+    except AttributeError:
+        clock = time.time
+    start = clock()
+    import CommandPanelGui
+    import CommandPanelGlobalDefinitions
+    ms = (clock() - start) * 1000
+    modules = startupModules()
+    deferred = [m for m in DEFERRED if m in modules]
+    assert not deferred, "imported at startup: " + ", ".join(deferred)
+    added = [m for m in modules if m not in STARTUP]
+    assert not added, "new startup imports: " + ", ".join(added)
+    assert ms <= IMPORT_BUDGET, "startup import %.1f ms" % ms
+
+
+@check("frequent")
+def checkFrequent():
+    """Frequent menu lists usage saved in a previous session."""
+    application()
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.GetGroup("Usage").SetString("data", ",".join(["Std_A;3;100.0",
+                                                    "Std_B;5;200.0",
+                                                    "Std_Gone;9;300.0"]))
+    addActions(["Std_A", "Std_B", "Std_C"])
+    import CommandPanelGui
+    import CommandPanelCommands as cpcmd
+    menu = cpcmd.FrequentMenu()
+    menu.populate()
+    names = [a.objectName() for a in menu.actions()]
+    assert names == ["Std_B", "Std_A"], names
+
+
+@check("refresh")
+def checkRefresh():
+    """Refreshed panel matches a new panel after actions are removed."""
+    application()
+    actions = addActions(["Std_A", "Std_B", "Std_C"])
+    import CommandPanelGui as cpg
+    import CommandPanelCommands as cpcmd
+    sub = {"workbench": "CheckWorkbench",
+           "uuid": "Sub",
+           "name": "Sub",
+           "commands": ["Std_C"]}
+    addWorkbench("CheckWorkbench", ["Std_A", "Std_B", sub], [sub])
+    cpg.onWorkbench()
+    pnl = cpg.panel
+    assert len(pnl.buttons) == 3, [b.key for b in pnl.buttons]
+    removeAction(actions["Std_B"])
+    removeAction(actions["Std_C"])
+    assert cpg.refreshPanel(pnl)
+    fresh = cpcmd.workbenchButtons("CheckWorkbench")
+    keys = [b.key for b in pnl.buttons]
+    assert keys == [b.key for b in fresh], keys
+    assert len(keys) == 2, keys
+    assert pnl.buttons[1].defaultAction() is None
+    assert fresh[1].defaultAction() is None
+
+
+@check("updates")
+def checkUpdates():
+    """Several update requests result in one panel update, applied after
+       the quiet period or synchronously on flush."""
+    app = application()
+    import time
+    import CommandPanelGui as cpg
+    addActions(["Std_A"])
+    addWorkbench("UpdateWorkbench", ["Std_A"])
+    cpg.onStart()
+    cpg.flushUpdate()
+    before = cpg.updateStats()
+    for x in range(5):
+        cpg.scheduleUpdate()
+    stats = cpg.updateStats()
+    assert stats["requested"] == before["requested"] + 5, stats
+    assert stats["executed"] == before["executed"], stats
+    deadline = time.time() + 5
+    while cpg.timerUpdate.isActive() and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+    stats = cpg.updateStats()
+    assert stats["executed"] == before["executed"] + 1, stats
+
+    cpg.scheduleUpdate()
+    cpg.scheduleUpdate()
+    cpg.flushUpdate()
+    assert not cpg.timerUpdate.isActive()
+    cpg.flushUpdate()
+    stats = cpg.updateStats()
+    assert stats["requested"] == before["requested"] + 7, stats
+    assert stats["executed"] == before["executed"] + 2, stats
+
+
+@check("entries")
+def checkEntries():
+    """Panel buttons are created from typed plan entries, including
+       toolbar commands, in regular and virtualized panels."""
+    application()
+    from PySide import QtGui
+    actions = addActions(["Std_A", "Std_B", "Tb_A"])
+    import CommandPanelGui as cpg
+    import CommandPanelCommands as cpcmd
+    import CommandPanelPlan as plan
+    sub = {"workbench": "EntryWorkbench",
+           "uuid": "Sub",
+           "name": "Sub",
+           "commands": ["Std_B"]}
+    addWorkbench("EntryWorkbench",
+                 ["Std_A", "CPSeparator", sub, "CPMenu", "CPSpacer"], [sub])
+    entries = cpcmd.workbenchCommands("EntryWorkbench")
+    assert all(isinstance(e, plan.Entry) for e in entries), entries
+    kinds = [e.kind for e in entries]
+    assert kinds == ["action", "separator", "menu", "menu", "spacer"], kinds
+    keys = [b.key for b in cpcmd.workbenchButtons("EntryWorkbench")]
+
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.SetBool("Virtual", 1)
+    p.SetInt("VirtualThreshold", 1)
+    cpg.updatePanel()
+    assert cpg.panel.area
+    assert [e.key for e in cpg.panel.area.keys] == keys, keys
+
+    mw = standins.getMainWindow()
+    tb = QtGui.QToolBar(mw)
+    tb.setObjectName("EntryToolbar")
+    mw.addToolBar(tb)
+    tb.addAction(actions["Tb_A"])
+    standins.addWorkbench("ToolbarWorkbench")
+    entries = cpcmd.workbenchCommands("ToolbarWorkbench")
+    assert entries == [plan.Entry("action", "Tb_A", None)], entries
+
+
+@check("icons")
+def checkIcons():
+    """Icon lookups do not read parameters and the cache follows the
+       IconCacheSize parameter."""
+    application()
+    import CommandPanelGui
+    import CommandPanelIcons as icons
+    icons.freecad()
+    standins.resetCounters()
+    for i in range(10):
+        icons.icon(":/icons/check" + str(i))
+    assert standins.counters["reads"] == 0, standins.counters
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.SetInt("IconCacheSize", 2)
+    assert icons.stats()["size"] == 2, icons.stats()
+    for i in range(5):
+        icons.icon(":/icons/check" + str(i))
+    assert icons.stats()["size"] == 2, icons.stats()
+
+
+@check("xpm")
+def checkXpm():
+    """XPM parser matches the old parser and also reads comment lines and
+       single line icons."""
+    application()
+    from PySide import QtGui
+    import CommandPanelCommon as cpc
+    body = ['"4 2 2 1"', '"a c #000000"', '"b c #FFFFFF"',
+            '"abab"', '"baba"']
+    xpm = "/* XPM */\nstatic char * icon[] = {\n%s};\n" % ",\n".join(body)
+    expected = oldXpmLines(xpm)
+    assert len(expected) == 5, expected
+    crlf = xpm.replace("\n", "\r\n")
+    assert oldXpmLines(crlf) == expected
+    assert cpc.xpmLines(xpm) == expected, cpc.xpmLines(xpm)
+    assert cpc.xpmLines(crlf) == expected, cpc.xpmLines(crlf)
+
+    comments = xpm.replace('"a c', '/* colors */\n"a c')
+    try:
+        oldXpmLines(comments)
+    except IndexError:
+        pass
+    else:
+        raise AssertionError("old parser reads comment lines")
+    assert cpc.xpmLines(comments) == expected, cpc.xpmLines(comments)
+    single = "static char * icon[] = {%s};" % ", ".join(body)
+    assert len(oldXpmLines(single)) == 1
+    assert cpc.xpmLines(single) == expected, cpc.xpmLines(single)
+    assert cpc.xpmLines("no icon") == []
+    assert not QtGui.QPixmap(cpc.xpmLines(single)).isNull()
+
+
+@check("observers")
+def checkObservers():
+    """External changes to workbench groups are observed before the
+       menus are used, and new menus do not invalidate the index."""
+    application()
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.GetGroup("User").GetGroup("SavedWorkbench").SetString("index", "")
+    import CommandPanelGui
+    import CommandPanel as cp
+    import CommandPanelCommon as cpc
+    import CommandPanelObserver as cpo
+    events = []
+    cpo.subscribe(lambda *args: events.append(args[:3]))
+    base = p.GetGroup("User").GetGroup("SavedWorkbench")
+    base.SetString("default", "CPMenu.User.SavedWorkbench.X")
+    assert ("workbench", "User", "SavedWorkbench") in events, events
+
+    del events[:]
+    cpo.watch("NewWorkbench")
+    p.GetGroup("System").GetGroup("NewWorkbench").SetString("index", "1")
+    assert ("index", "System", "NewWorkbench") in events, events
+
+    del events[:]
+    cp.addMenu({"workbench": "MenuWorkbench",
+                "uuid": "A",
+                "name": "A",
+                "commands": ["Std_A"]})
+    cp.addMenu({"workbench": "MenuWorkbench",
+                "uuid": "B",
+                "name": "B",
+                "commands": ["Std_A"]})
+    cpc.newGroup("CPMenu.User.MenuWorkbench")
+    cpc.newGroup("CPMenu.User.MenuWorkbench")
+    assert not [e for e in events if e[0] == "index"], events
+    assert cpc.mutating == 0
+
+
+
+@check("menuEvents")
+def checkMenuEvents():
+    """Menu default, name and hash writes keep the cached panel, menu
+       command changes update it."""
+    application()
+    actions = addActions(["Std_A", "Std_B"])
+    import CommandPanelGui as cpg
+    import CommandPanelCommon as cpc
+    import CommandPanelCache as cache
+    sub = {"workbench": "EventWorkbench",
+           "uuid": "Sub",
+           "name": "Sub",
+           "commands": ["Std_A", "Std_B"]}
+    addWorkbench("EventWorkbench", ["Std_A", sub], [sub])
+    cpg.updatePanel()
+    pnl = cpg.panel
+    g = cpc.findGroup("CPMenu.System.EventWorkbench.Sub")
+    requested = cpg.rebuilds["requested"]
+    g.SetString("Default", "Std_B")
+    g.SetString("name", "Renamed")
+    g.SetString("hash", "0")
+    assert cpg.rebuilds["requested"] == requested, cpg.rebuilds
+    assert pnl in cache.panels.values()
+    g.SetString("commands", "Std_B")
+    assert cpg.rebuilds["requested"] == requested + 1, cpg.rebuilds
+    assert pnl not in cache.panels.values()
+
+
+@check("plan")
+def checkPlan():
+    """Plan follows external edits of unvisited workbench groups and
+       plan problems are logged once."""
+    application()
+    addActions(["Std_A", "Std_B"])
+    import CommandPanelGui
+    import CommandPanelPlan as plan
+    addWorkbench("PlanWorkbench", ["Std_A"])
+    keys = [e.key for e in plan.resolve("PlanWorkbench").entries]
+    assert keys == ["Std_A"], keys
+
+    # Menu written directly, as a macro or preferences import would
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    base = p.GetGroup("User").GetGroup("PlanWorkbench")
+    base.GetGroup("1").SetString("uuid", "U")
+    base.GetGroup("1").SetString("commands", "Std_B")
+    base.SetString("index", "1")
+    base.SetString("default", "CPMenu.User.PlanWorkbench.U")
+    keys = [e.key for e in plan.resolve("PlanWorkbench").entries]
+    assert keys == ["Std_B"], keys
+
+    # Dangling default menu
+    base.SetString("default", "CPMenu.User.PlanWorkbench.Missing")
+    del standins.messages[:]
+    plan.compilePlan("PlanWorkbench")
+    plan.compilePlan("PlanWorkbench")
+    warnings = [m for m in standins.messages if m[0] == "Warning"]
+    assert len(warnings) == 1, warnings
+
+
+
+@check("toolbars")
+def checkToolbars():
+    """Toolbar commands follow toolbar button menus and keep one cache
+       entry per toolbar set."""
+    application()
+    from PySide import QtGui
+    actions = addActions(["Std_A", "Std_B", "Std_C"])
+    import CommandPanelGui
+    import CommandPanelToolbars as cpt
+    mw = standins.getMainWindow()
+    tb = QtGui.QToolBar(mw)
+    tb.setObjectName("CheckToolbar")
+    mw.addToolBar(tb)
+    tb.addAction(actions["Std_A"])
+    menu = QtGui.QMenu(mw)
+    btn = QtGui.QToolButton(tb)
+    btn.setMenu(menu)
+    tb.addWidget(btn)
+    assert cpt.toolbarCommands("CheckToolbar") == ["Std_A"]
+    menu.addAction(actions["Std_B"])
+    assert cpt.toolbarCommands("CheckToolbar") == ["Std_A", "Std_B"]
+    for name in ["Std_D", "Std_E", "Std_F"]:
+        addActions([name])
+        flush()
+        cpt.toolbarCommands("CheckToolbar")
+    assert len(cpt.commandCache) == 1, cpt.commandCache
+
+
+@check("fallback")
+def checkFallback():
+    """Cached fallback panel of a workbench without menus follows the
+       visible toolbars."""
+    application()
+    from PySide import QtGui
+    actions = addActions(["Tb_A", "Tb_B"])
+    import CommandPanelGui as cpg
+    mw = standins.getMainWindow()
+    toolbars = {}
+    for name, cmd in [("One", "Tb_A"), ("Two", "Tb_B")]:
+        tb = QtGui.QToolBar(mw)
+        tb.setObjectName(name)
+        mw.addToolBar(tb)
+        tb.addAction(actions[cmd])
+        toolbars[name] = tb
+    standins.addWorkbench("ToolbarWorkbench")
+    standins.addWorkbench("OtherWorkbench")
+    for wb in ["ToolbarWorkbench", "OtherWorkbench", "ToolbarWorkbench"]:
+        standins.activateWorkbench(wb)
+        cpg.updatePanel()
+    keys = [b.key for b in cpg.panel.buttons]
+    assert keys == ["Tb_A", "Tb_B"], keys
+    toolbars["Two"].toggleViewAction().setVisible(False)
+    standins.activateWorkbench("OtherWorkbench")
+    cpg.updatePanel()
+    standins.activateWorkbench("ToolbarWorkbench")
+    cpg.updatePanel()
+    keys = [b.key for b in cpg.panel.buttons]
+    assert keys == ["Tb_A"], keys
+
+
+@check("timing")
+def checkTiming():
+    """Panel phases, including the layout pass, are timed when enabled
+       and not recorded when disabled."""
+    application()
+    addActions(["Std_A", "Std_B"])
+    import CommandPanel as cp
+    import CommandPanelGui as cpg
+    import CommandPanelCache as cache
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    sub = {"workbench": "TimingWorkbench",
+           "uuid": "Sub",
+           "name": "Sub",
+           "commands": ["Std_B"]}
+    addWorkbench("TimingWorkbench", ["Std_A", sub], [sub])
+    cpg.onWorkbench()
+    assert cp.stats() == {}, cp.stats()
+
+    p.SetBool("Stats", True)
+    cache.invalidate()
+    cpg.panel.discard()
+    cpg.panel = None
+    cpg.onWorkbench()
+    cpg.panel.show()
+    cpg.panel.layout().activate()
+    cpg.panel.buttonLayout.setGeometry(cpg.panel.rect())
+    phases = cp.stats(reset=True)["TimingWorkbench"]
+    for phase in ["update", "plan", "actionList", "findGroup",
+                  "defaultAction", "buttonFactory", "menuButton",
+                  "buttons", "layoutButtons", "layout"]:
+        assert phase in phases, (phase, sorted(phases))
+    assert cp.stats() == {}
+
+
+
+@check("search")
+def checkSearch():
+    """Search categories are not overridden by length or usage, and
+       commands are found by the workbench owning their toolbar."""
+    application()
+    from PySide import QtGui
+    actions = addActions(["Part_Box",
+                          "Std_Other",
+                          "Std_Boxes",
+                          "Std_Bozx"])
+    actions["Part_Box"].setText("Box with a very long menu text to rank")
+    actions["Std_Other"].setText("Make box from the selected edges, "
+                                 "faces and wires of the model")
+    actions["Std_Boxes"].setText("Xboxes")
+    actions["Std_Bozx"].setText("Bozx")
+    import CommandPanelGui
+    import CommandPanelSearch as search
+    import CommandPanelUsage as usage
+    usage.load()
+    for name in ["Std_Boxes", "Std_Bozx"]:
+        usage.counts[name] = 1000
+        usage.last[name] = 1.0
+    names = search.search("box")
+    assert names == ["Part_Box", "Std_Other", "Std_Boxes", "Std_Bozx"], names
+
+    standins.addWorkbench("ModelWorkbench", "Modelling")
+    standins.activateWorkbench("ModelWorkbench")
+    mw = standins.getMainWindow()
+    tb = QtGui.QToolBar(mw)
+    tb.setObjectName("Shapes")
+    tb.setWindowTitle("Shapes")
+    mw.addToolBar(tb)
+    tb.addAction(actions["Part_Box"])
+    search.invalidate()
+    names = search.search("modelling")
+    assert names == ["Part_Box"], names
+
+
+
+@check("collect")
+def checkCollect():
+    """Presets of workbenches not loaded in the session are kept,
+       presets of removed workbenches are collected and collecting again
+       writes nothing."""
+    application()
+    import CommandPanelGui
+    import CommandPanel as cp
+    import CommandPanelCommon as cpc
+
+    def preset(wb):
+        return {"workbench": wb,
+                "uuid": "Preset",
+                "name": "Preset",
+                "commands": ["Std_A"]}
+
+    for wb in ["UsedWorkbench", "UnusedWorkbench"]:
+        standins.addWorkbench(wb)
+    cp.addMenus([preset("UsedWorkbench"),
+                 preset("UnusedWorkbench"),
+                 preset("RemovedWorkbench")])
+
+    # Next session, only UsedWorkbench is activated
+    cp.registered.clear()
+    cp.activated.clear()
+    cpc.invalidateIndex()
+    standins.resetCounters()
+    cp.addMenus([preset("UsedWorkbench")])
+    cp.activated.add("UsedWorkbench")
+    assert standins.counters["writes"] == 0, standins.counters
+    cp.collect()
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    system = p.GetGroup("System")
+    workbenches = cpc.splitIndex(system, "workbenches")
+    assert workbenches == ["UnusedWorkbench", "UsedWorkbench"], workbenches
+    for wb in workbenches:
+        assert cpc.findGroup("CPMenu.System." + wb + ".Preset"), wb
+    assert not system.HasGroup("RemovedWorkbench")
+    # Nothing left to collect and no default to remove
+    standins.resetCounters()
+    cp.collect()
+    assert standins.counters["writes"] == 0, standins.counters
+
+
+@check("slots")
+def checkSlots():
+    """Slot allocator keeps only the holes and menu groups are compacted
+       on request only, keeping menu order and all group contents."""
+    application()
+    import CommandPanelGui
+    import CommandPanel as cp
+    import CommandPanelCommon as cpc
+    slots = cpc.SlotAllocator(["1", "5", "x", "3", "9"])
+    assert sorted(slots.free) == [2, 4, 6, 7, 8], slots.free
+    slots.release("5")
+    assert [slots.allocate() for x in range(7)] == \
+        ["2", "4", "5", "6", "7", "8", "10"]
+
+    standins.addWorkbench("SlotWorkbench")
+    domains = cp.addMenus([{"workbench": "SlotWorkbench",
+                            "uuid": uid,
+                            "name": uid,
+                            "commands": ["Std_" + uid]}
+                           for uid in ["A", "B", "C"]])
+    cpc.deleteGroup(domains[1])
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    base = p.GetGroup("System").GetGroup("SlotWorkbench")
+    assert base.GetString("index") == "1,3", base.GetString("index")
+    g = base.GetGroup("3")
+    g.SetBool("Expand", 1)
+    g.SetInt("Extra", 7)
+    g.SetFloat("Ratio", 0.5)
+    g.GetGroup("Sub").SetString("Note", "kept")
+    CommandPanelGui.onClose()
+    assert base.GetString("index") == "1,3", base.GetString("index")
+    assert cp.compact("SlotWorkbench") == 1
+    assert cp.compact() == 0
+    assert base.GetString("index") == "1,2", base.GetString("index")
+    assert not base.HasGroup("3")
+    for domain, command in [(domains[0], "Std_A"), (domains[2], "Std_C")]:
+        g = cpc.findGroup(domain)
+        assert g and g.GetString("commands") == command, domain
+    g = base.GetGroup("2")
+    assert g.GetBool("Expand") and g.GetInt("Extra") == 7
+    assert g.GetFloat("Ratio") == 0.5
+    assert g.GetGroup("Sub").GetString("Note") == "kept"
+
+
+@check("groups")
+def checkGroups():
+    """Warm menu group lookup reads no parameters and group handles
+       follow deleted and reused slots."""
+    application()
+    import CommandPanel as cp
+    import CommandPanelCommon as cpc
+    domains = cp.addMenus([{"workbench": "GroupWorkbench",
+                            "uuid": uid,
+                            "name": uid,
+                            "commands": ["Std_" + uid]}
+                           for uid in ["A", "B"]])
+    cpc.invalidateIndex()
+    for domain in domains:
+        cpc.findGroup(domain)
+    standins.resetCounters()
+    for domain in domains:
+        assert cpc.findGroup(domain)
+    assert standins.counters["reads"] == 0, standins.counters
+
+    cpc.deleteGroup(domains[0])
+    assert not cpc.findGroup(domains[0])
+    g = cpc.newGroup("CPMenu.System.GroupWorkbench.C")
+    g.SetString("commands", "Std_C")
+    assert cpc.findGroup("CPMenu.System.GroupWorkbench.C") is g
+    assert cpc.findGroup(domains[1]).GetString("commands") == "Std_B"
+
+
+@check("palette")
+def checkPalette():
+    """Menus of all workbenches are searched and the palette is offered
+       in dock and menu mode."""
+    application()
+    import CommandPanelGui as cpg
+    import CommandPanel as cp
+    import CommandPanelCommon as cpc
+    import CommandPanelSearch as search
+    addActions(["Std_A"])
+    domains = cp.addMenus([{"workbench": wb,
+                            "uuid": "Menu",
+                            "name": "Bracket " + wb,
+                            "commands": ["Std_A"]}
+                           for wb in ["SeenWorkbench", "UnseenWorkbench"]])
+    cpc.invalidateIndex()
+    cpc.domainIndex("System", "SeenWorkbench")
+    search.invalidate()
+    assert search.search("bracket") == domains, search.search("bracket")
+
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.SetBool("Menu", 0)
+    cpg.setContainer()
+    cpg.onInvoke()
+    palette = cpg.commandPalette
+    assert palette.parentWidget() is cpg.dockWidget
+    assert not palette.isHidden()
+    palette.edit.setText("bracket")
+    palette.onSearch("bracket")
+    assert palette.results.count() == 2
+    assert cpg.scroll.isHidden()
+    palette.triggered.emit()
+    assert palette.isHidden() and not cpg.scroll.isHidden()
+
+    p.SetBool("Menu", 1)
+    cpg.setContainer()
+    assert palette.parentWidget() is cpg.popup
+    assert not palette.isHidden()
+
+
+@check("actions")
+def checkActions():
+    """Actions added to the main window, toolbars and menus after the
+       first lookup are registered without a full rescan, and a switch
+       to a cached panel does not scan the main window."""
+    application()
+    from PySide import QtGui
+    import CommandPanelGui as cpg
+    import CommandPanelCommon as cpc
+    mw = standins.getMainWindow()
+    standins.addWorkbench("ActionWorkbench")
+    standins.addWorkbench("OtherWorkbench")
+    cpg.onStart()
+    toolbar = QtGui.QToolBar(mw)
+    addActions(["Std_A"])
+    assert "Std_A" in cpc.actionList()
+
+    added = addActions(["Std_B"])
+    assert "Std_B" in cpc.actionList()
+    removeAction(added["Std_B"])
+    assert "Std_B" not in cpc.actionList()
+
+    addActions(["Std_C"], toolbar)
+    assert "Std_C" in cpc.actionList()
+    holder = QtGui.QWidget()
+    toolbar.addAction(addActions(["Std_D"], holder)["Std_D"])
+    assert "Std_D" in cpc.actionList()
+    menu = QtGui.QMenu(mw)
+    cpc.actionList()
+    menu.addAction(addActions(["Std_E"], holder)["Std_E"])
+    other = QtGui.QToolBar(mw)
+    addActions(["Std_F"], other)
+    names = cpc.actionList()
+    assert "Std_E" in names and "Std_F" in names, sorted(names)
+
+    for wb in ["OtherWorkbench", "ActionWorkbench"]:
+        standins.activateWorkbench(wb)
+        cpg.updatePanel()
+    cpc.actionList()
+    scans = []
+    full = cpc.scanActions
+    cpc.scanActions = lambda obj: scans.append(obj) or full(obj)
+    # Menu bar actions change on every switch, as in FreeCAD
+    for wb in ["OtherWorkbench", "ActionWorkbench"]:
+        standins.activateWorkbench(wb)
+        cpg.updatePanel()
+    assert not scans, scans
+
+
+@check("buttons")
+def checkButtons():
+    """Button signals reach the button slots: clicked commands are
+       recorded and menu buttons invoke the menu in menu mode."""
+    application()
+    import CommandPanelGui as cpg
+    import CommandPanelCommands as cpcmd
+    import CommandPanelSettings as cps
+    import CommandPanelPlan as plan
+    import CommandPanelUsage as usage
+    actions = addActions(["Std_A"])
+    p = standins.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.SetBool("Menu", 1)
+    invoked = []
+    cpg.onInvoke = lambda: invoked.append(True)
+    btn = cpcmd.commandButton(plan.entry("Std_A"), actions, cps.current())
+    btn.click()
+    assert usage.count("Std_A") == 1, usage.count("Std_A")
+    assert invoked == [True], invoked
+
+
+@check("menus")
+def checkMenus():
+    """Command menu is empty until first shown, filled exactly once and
+       the button default is the stored menu default."""
+    application()
+    import CommandPanelGui
+    import CommandPanel as cp
+    import CommandPanelCommands as cpcmd
+    import CommandPanelCommon as cpc
+    import CommandPanelPlan as plan
+    actions = addActions(["Std_A", "Std_B"])
+    domain = cp.addMenu({"workbench": "MenuWorkbench",
+                         "uuid": "Menu",
+                         "name": "Menu",
+                         "commands": ["Std_A", "CPSeparator", "Std_B"]})
+    cpc.findGroup(domain).SetString("Default", "Std_B")
+    btn = cpcmd.commandButton(plan.entry(domain), cpc.actionList())
+    assert btn.defaultAction() is actions["Std_B"], btn.defaultAction()
+    menu = btn.menu()
+    assert not menu.actions(), menu.actions()
+    menu.aboutToShow.emit()
+    names = [a.objectName() or a.text() for a in menu.actions()]
+    assert names == ["Std_A", "", "Std_B", "", "Expand"], names
+    menu.aboutToShow.emit()
+    assert len(menu.actions()) == len(names), menu.actions()
+    assert menu.defaultAction() is actions["Std_B"], menu.defaultAction()
+
+
+@check("usage")
+def checkUsage():
+    """Usage is recorded for panel buttons and menus only, not for the
+       same actions triggered outside of the panel."""
+    application()
+    from PySide import QtCore
+    import CommandPanelGui
+    import CommandPanel as cp
+    import CommandPanelCommands as cpcmd
+    import CommandPanelCommon as cpc
+    import CommandPanelPlan as plan
+    import CommandPanelUsage as usage
+    actions = addActions(["Std_A", "Std_B"])
+    domain = cp.addMenu({"workbench": "UsageWorkbench",
+                         "uuid": "Menu",
+                         "name": "Menu",
+                         "commands": ["Std_A", "Std_B"]})
+    buttons = [cpcmd.commandButton(plan.entry(cmd), cpc.actionList())
+               for cmd in ["Std_A", "Std_A", domain]]
+    menu = buttons[2].menu()
+    menu.populate()
+    actions["Std_A"].trigger()
+    actions["Std_B"].trigger()
+    assert usage.count("Std_A") == 0, usage.count("Std_A")
+    assert usage.count("Std_B") == 0, usage.count("Std_B")
+
+    buttons[0].click()
+    assert usage.count("Std_A") == 1, usage.count("Std_A")
+
+    # Menu is hidden before the chosen action is triggered
+    menu.aboutToShow.emit()
+    menu.aboutToHide.emit()
+    actions["Std_B"].trigger()
+    assert usage.count("Std_B") == 1, usage.count("Std_B")
+    QtCore.QCoreApplication.processEvents()
+    actions["Std_B"].trigger()
+    assert usage.count("Std_B") == 1, usage.count("Std_B")
+
+
+def run(name):
+    """Run the check in a new interpreter. Return output or None."""
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), name],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT)
+    out = proc.communicate()[0].decode("UTF-8", "replace")
+    if proc.returncode:
+        return out
+    return None
+
+
+def main(argv=None):
+    """Run checks."""
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) == 1 and argv[0] in checks:
+        checks[argv[0]]()
+        return 0
+    failed = 0
+    for name in argv or checks:
+        if name not in checks:
+            print("unknown check " + name)
+            failed += 1
+            continue
+        out = run(name)
+        if out is None:
+            print("ok     " + name)
+        else:
+            print("FAILED " + name)
+            print(out)
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
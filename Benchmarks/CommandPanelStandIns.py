@@ -0,0 +1,294 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Stand-ins for benchmarks.
+
+Lightweight FreeCAD and FreeCADGui modules, used to run the command
+panel without FreeCAD. Parameter groups keep values in memory, notify
+attached observers and count reads and writes. When PySide (Qt4) is not
+available, PySide2 is exposed as PySide the same way FreeCAD does."""
+
+
+import os
+import sys
+import types
+from collections import OrderedDict
+
+
+counters = {"reads": 0, "writes": 0}
+roots = {}
+workbenches = OrderedDict()
+current = [None]
+mainWindow = [None]
+messages = []
+
+
+# GetContents type names of the parameter kinds
+contentTypes = {"String": "String",
+                "Bool": "Boolean",
+                "Int": "Integer",
+                "Float": "Float",
+                "Unsigned": "Unsigned Long"}
+
+
+class ParameterGroup(object):
+    """In memory parameter group with FreeCAD ParameterGrp interface."""
+    def __init__(self, name):
+        self.name = name
+        self.values = {}
+        self.groups = OrderedDict()
+        self.observers = []
+
+    def notify(self, name):
+        """Notify attached observers."""
+        for obs in list(self.observers):
+            obs.OnChange(self, name)
+
+    def get(self, kind, name, default):
+        counters["reads"] += 1
+        return self.values.get((kind, name), default)
+
+    def set(self, kind, name, value):
+        counters["writes"] += 1
+        self.values[(kind, name)] = value
+        self.notify(name)
+
+    def rem(self, kind, name):
+        counters["writes"] += 1
+        if self.values.pop((kind, name), None) is not None:
+            self.notify(name)
+
+    def GetString(self, name, default=""):
+        return self.get("String", name, default)
+
+    def SetString(self, name, value):
+        self.set("String", name, value)
+
+    def RemString(self, name):
+        self.rem("String", name)
+
+    def GetBool(self, name, default=False):
+        return bool(self.get("Bool", name, default))
+
+    def SetBool(self, name, value):
+        self.set("Bool", name, bool(value))
+
+    def RemBool(self, name):
+        self.rem("Bool", name)
+
+    def GetInt(self, name, default=0):
+        return int(self.get("Int", name, default))
+
+    def SetInt(self, name, value):
+        self.set("Int", name, int(value))
+
+    def RemInt(self, name):
+        self.rem("Int", name)
+
+    def GetFloat(self, name, default=0.0):
+        return float(self.get("Float", name, default))
+
+    def SetFloat(self, name, value):
+        self.set("Float", name, float(value))
+
+    def GetUnsigned(self, name, default=0):
+        return int(self.get("Unsigned", name, default))
+
+    def SetUnsigned(self, name, value):
+        self.set("Unsigned", name, int(value))
+
+    def GetContents(self):
+        counters["reads"] += 1
+        if not self.values:
+            return None
+        return [(contentTypes[kind], name, value)
+                for (kind, name), value in self.values.items()]
+
+    def GetGroup(self, name):
+        counters["reads"] += 1
+        try:
+            return self.groups[name]
+        except KeyError:
+            counters["writes"] += 1
+            self.groups[name] = ParameterGroup(name)
+            return self.groups[name]
+
+    def GetGroups(self):
+        return list(self.groups)
+
+    def HasGroup(self, name):
+        return name in self.groups
+
+    def RemGroup(self, name):
+        counters["writes"] += 1
+        self.groups.pop(name, None)
+
+    def GetGroupName(self):
+        return self.name
+
+    def Clear(self):
+        counters["writes"] += 1
+        self.values.clear()
+        self.groups.clear()
+
+    def Attach(self, observer):
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def Detach(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+
+def ParamGet(path):
+    """Parameter group for the path."""
+    try:
+        return roots[path]
+    except KeyError:
+        roots[path] = ParameterGroup(path.rsplit("/", 1)[-1])
+        return roots[path]
+
+
+def resetParameters():
+    """Remove all parameters and reset counters."""
+    roots.clear()
+    resetCounters()
+
+
+def resetCounters():
+    """Reset parameter read and write counters."""
+    counters["reads"] = 0
+    counters["writes"] = 0
+
+
+class Console(object):
+    """FreeCAD console messages, collected in memory."""
+    def PrintMessage(self, text):
+        messages.append(("Message", text))
+
+    def PrintLog(self, text):
+        messages.append(("Log", text))
+
+    def PrintWarning(self, text):
+        messages.append(("Warning", text))
+
+    def PrintError(self, text):
+        messages.append(("Error", text))
+
+
+def Version():
+    """FreeCAD version."""
+    return ["0", "19", "0"]
+
+
+def addWorkbench(name, menuText=None):
+    """Add workbench to the workbench list."""
+    cls = type(str(name), (object,), {})
+    wb = cls()
+    wb.MenuText = menuText or name
+    wb.Icon = ":/icons/freecad"
+    workbenches[name] = wb
+    if current[0] is None:
+        current[0] = wb
+    return wb
+
+
+def listWorkbenches():
+    """Dictionary of workbenches."""
+    return workbenches
+
+
+def activeWorkbench():
+    """Active workbench."""
+    return current[0]
+
+
+def activateWorkbench(name):
+    """Activate workbench and emit workbench activated signal."""
+    if name not in workbenches:
+        return False
+    current[0] = workbenches[name]
+    if mainWindow[0]:
+        mainWindow[0].workbenchActivated.emit(name)
+    return True
+
+
+def getMainWindow():
+    """Main window, created on first use."""
+    if mainWindow[0] is None:
+        from PySide import QtGui
+        from PySide import QtCore
+
+        class MainWindow(QtGui.QMainWindow):
+            """Main window with FreeCAD main window signals."""
+            mainWindowClosed = QtCore.Signal()
+            workbenchActivated = QtCore.Signal(str)
+
+        mainWindow[0] = MainWindow()
+        mainWindow[0].setProperty("eventLoop", True)
+    return mainWindow[0]
+
+
+def pysideModule():
+    """Expose PySide2 as PySide, with QtWidgets merged into QtGui."""
+    try:
+        from PySide import QtGui
+        QtGui.QToolButton
+        return
+    except (ImportError, AttributeError):
+        pass
+    from PySide2 import QtCore
+    from PySide2 import QtGui
+    from PySide2 import QtWidgets
+    gui = types.ModuleType("PySide.QtGui")
+    for module in [QtGui, QtWidgets]:
+        for name in dir(module):
+            if not name.startswith("_"):
+                setattr(gui, name, getattr(module, name))
+    for name in ["QSortFilterProxyModel", "QStringListModel"]:
+        setattr(gui, name, getattr(QtCore, name))
+    package = types.ModuleType("PySide")
+    package.QtCore = QtCore
+    package.QtGui = gui
+    sys.modules["PySide"] = package
+    sys.modules["PySide.QtCore"] = QtCore
+    sys.modules["PySide.QtGui"] = gui
+
+
+def install():
+    """Install stand-ins and add the command panel to the module path."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    pysideModule()
+
+    app = types.ModuleType("FreeCAD")
+    app.ParamGet = ParamGet
+    app.Version = Version
+    app.Console = Console()
+    sys.modules["FreeCAD"] = app
+
+    gui = types.ModuleType("FreeCADGui")
+    gui.getMainWindow = getMainWindow
+    gui.listWorkbenches = listWorkbenches
+    gui.activeWorkbench = activeWorkbench
+    gui.activateWorkbench = activateWorkbench
+    sys.modules["FreeCADGui"] = gui
+
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -20,18 +20,149 @@
 """Command panel for FreeCAD - API."""
 
 
+import hashlib
+import FreeCADGui as Gui
 import CommandPanelCommon as cpc
+import CommandPanelTiming as timing
 
 
 p = cpc.p
+registered = set()
+# Workbenches activated in this session
+activated = set()
+
+
+def presetHash(name, commands, default):
+    """Content hash of the menu definition."""
+    data = repr((name, commands, default))
+    try:
+        data = data.encode("UTF-8")
+    except UnicodeDecodeError:
+        pass
+    return hashlib.sha1(data).hexdigest()
+
+
+def addWorkbenches(wbs):
+    """Add workbenches to the list of workbenches with system presets."""
+    system = p.GetGroup("System")
+    workbenches = cpc.splitIndex(system, "workbenches")
+    added = [wb for wb in wbs if wb not in workbenches]
+    if added:
+        system.SetString("workbenches", ",".join(workbenches + added))
+
+
+def menuKey(menu):
+    """Validated workbench and uuid of the menu definition."""
+    try:
+        wb = menu["workbench"]
+        uid = menu["uuid"]
+    except (KeyError, TypeError):
+        return None, None
+    if "." in wb or "," in wb or "." in uid or "," in uid:
+        return None, None
+    return wb, uid
+
+
+def menuCommands(menu, domains):
+    """Valid command names of the menu definition. Menu definitions
+       from the same batch are replaced with their domain."""
+    if "commands" not in menu:
+        return None
+    commands = []
+    for cmd in menu["commands"]:
+        if isinstance(cmd, dict):
+            cmd = domains.get(id(cmd))
+            if cmd:
+                commands.append(cmd)
+        elif cmd.startswith("CPMenu") and "," not in cmd:
+            commands.append(cmd)
+        elif "." not in cmd and "," not in cmd:
+            commands.append(cmd)
+        else:
+            pass
+    return commands
+
+
+def installed():
+    """Names of the installed workbenches and the global panel."""
+    names = set(["GlobalPanel"])
+    wbs = Gui.listWorkbenches()
+    for wb in wbs:
+        names.add(wb)
+        names.add(wbs[wb].__class__.__name__)
+    return names
+
+
+def collect():
+    """Remove system presets not added in this session. Presets are
+       collected only for workbenches loaded in this session (activated
+       or with presets added), so presets added on workbench activation
+       are kept for workbenches not used. All presets of workbenches no
+       longer installed are removed."""
+    system = p.GetGroup("System")
+    workbenches = cpc.splitIndex(system, "workbenches")
+    names = installed()
+    loaded = activated | set([wb for wb, uid in registered])
+    keepWb = []
+    for wb in workbenches:
+        base = system.GetGroup(wb)
+        index = cpc.splitIndex(base)
+        if wb in names and wb not in loaded:
+            keepWb.append(wb)
+            continue
+        keep = []
+        for i in index:
+            if (wb, base.GetGroup(i).GetString("uuid")) in registered:
+                keep.append(i)
+            else:
+                base.RemGroup(i)
+        if not keep:
+            system.RemGroup(wb)
+            continue
+        keepWb.append(wb)
+        if keep != index:
+            base.SetString("index", ",".join(keep))
+        default = base.GetString("default")
+        if default and (wb, cpc.splitDomain(default)[3]) not in registered:
+            base.RemString("default")
+    if keepWb != workbenches:
+        system.SetString("workbenches", ",".join(keepWb))
+    cpc.invalidateIndex("System")
+
+
+def compact(workbench=None):
+    """compact(workbench=None)
+
+    Renumber user and system menu groups of the workbench (all
+    workbenches if None) to slots 1 to n. Menu order, domains and group
+    contents are kept. Return the number of workbench groups compacted.
+
+    import CommandPanel as cp
+
+
+    cp.compact()                                        # All workbenches
+    cp.compact("PartWorkbench")                         # One workbench"""
+
+    count = 0
+    for source in ["User", "System"]:
+        if workbench:
+            wbs = [workbench]
+        else:
+            wbs = p.GetGroup(source).GetGroups()
+        for wb in wbs:
+            if cpc.compactGroups(source, wb):
+                count += 1
+    return count
 
 
 def addMenu(menu=None):
     """addMenu({menu})
 
     Command panel API provides ability to preset commands for workbench.
-    Settings are deleted when FreeCAD exits normally. Following is a two
-    menus example for Start workbench.
+    Settings are kept between sessions and unchanged menus are not
+    written again. Menus not added in the session are removed when
+    FreeCAD exits normally. Following is a two menus example for Start
+    workbench.
 
     import CommandPanel as cp
 
@@ -67,51 +198,115 @@ def addMenu(menu=None):
 
     cp.addMenu(menuDefault)"""
 
-    # Workbench
-    if menu and "workbench" in menu:
-        wb = menu["workbench"]
-        if "." in wb or "," in wb:
-            wb = None
-    else:
-        wb = None
+    return addMenus([menu])[0]
 
-    # UUID
-    if wb and "uuid" in menu:
-        uid = menu["uuid"]
-        if "." in uid or "," in uid:
-            uid = None
-    else:
-        uid = None
 
-    if wb and uid:
-        domain = ".".join(["CPMenu", "System", wb, uid])
+def addMenus(menus):
+    """addMenus([menu, ...])
+
+    Add many menus at once. Definitions are validated once, new menu
+    groups are created with a single index write per workbench and only
+    changed menus are written. Commands can reference other menu
+    definitions of the same batch. Return list of domains, or None for
+    invalid definitions, in the order of the definitions.
+
+    import CommandPanel as cp
+
+
+    menuDemo = {
+        "workbench": "StartWorkbench",
+        "uuid": "StartDemo",
+        "name": "Demo",
+        "commands": ["Std_ViewFront", "Std_ViewTop"]}
+
+
+    menuDefault = {
+        "workbench": "StartWorkbench",
+        "uuid": "StartDefault",
+        "name": "Default",
+        "default": True,
+        "commands": ["CPGlobalDefault", menuDemo]}   # Reference menuDemo
+
+
+    domainDemo, domainDefault = cp.addMenus([menuDemo, menuDefault])"""
+
+    domains = {}
+    valid = []
+    for menu in menus:
+        wb, uid = menuKey(menu)
+        if wb and uid:
+            domain = ".".join(["CPMenu", "System", wb, uid])
+            domains[id(menu)] = domain
+            valid.append((menu, wb, uid, domain))
+
+    # Menus with changed definition
+    changed = []
+    missing = {}
+    for menu, wb, uid, domain in valid:
+        registered.add((wb, uid))
+        commands = menuCommands(menu, domains)
+        digest = presetHash(menu.get("name"), commands, "default" in menu)
         group = cpc.findGroup(domain)
+        if group and group.GetString("hash") == digest:
+            continue
+        changed.append((menu, wb, domain, commands, digest))
         if not group:
-            group = cpc.newGroup(domain)
-        if group:
-            # UUID
-            group.SetString("uuid", uid)
-            # Name
-            if "name" in menu:
-                group.SetString("name", menu["name"])
-            # Commands
-            if "commands" in menu:
-                temp = []
-                for cmd in menu["commands"]:
-                    if cmd.startswith("CPMenu") and "," not in cmd:
-                        temp.append(cmd)
-                    elif "." not in cmd and "," not in cmd:
-                        temp.append(cmd)
-                    else:
-                        pass
-                group.SetString("commands", ",".join(temp))
-            # Default
-            if "default" in menu:
-                base = p.GetGroup("System").GetGroup(wb)
-                base.SetString("default", domain)
-        else:
-            domain = None
-    else:
-        domain = None
+            uids = missing.setdefault(wb, [])
+            if uid not in uids:
+                uids.append(uid)
+
+    # New groups, single index write per workbench
+    for wb in missing:
+        cpc.newGroups("System", wb, missing[wb])
+    if changed:
+        addWorkbenches(sorted(set([c[1] for c in changed])))
+
+    for menu, wb, domain, commands, digest in changed:
+        group = cpc.findGroup(domain)
+        if not group:
+            domains.pop(id(menu), None)
+            continue
+        # Name
+        if "name" in menu:
+            group.SetString("name", menu["name"])
+        # Commands
+        if commands is not None:
+            group.SetString("commands", ",".join(commands))
+        # Default
+        base = p.GetGroup("System").GetGroup(wb)
+        if "default" in menu:
+            base.SetString("default", domain)
+        elif base.GetString("default") == domain:
+            base.RemString("default")
+        # Hash
+        group.SetString("hash", digest)
+
+    return [domains.get(id(menu)) for menu in menus]
+
+
+def stats(reset=False):
+    """stats(reset=False)
+
+    Phase timing of panel updates and preferences dialog populate, as
+    {workbench: {phase: histogram}}. Histogram provides count, total,
+    mean, min and max time in milliseconds and buckets as list of
+    (upper bound, count). Timing is enabled with the Stats parameter
+    and recorded times are removed with reset.
+
+    import FreeCAD as App
+    import CommandPanel as cp
+
+
+    p = App.ParamGet("User parameter:BaseApp/CommandPanel")
+    p.SetBool("Stats", 1)                               # Enable timing
+
+    # Activate workbenches ...
+
+    for wb, phases in cp.stats().items():
+        for phase, h in phases.items():
+            print(wb, phase, h["count"], h["mean"], h["max"])"""
 
-    return domain
+    result = timing.stats()
+    if reset:
+        timing.reset()
+    return result
@@ -0,0 +1,86 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Panel cache."""
+
+
+from collections import OrderedDict
+import CommandPanelCommon as cpc
+
+
+p = cpc.p
+panels = OrderedDict()
+
+
+def cacheSize():
+    """Maximum number of cached panels."""
+    return max(p.GetInt("CacheSize", 5), 1)
+
+
+def lookup(key):
+    """Return cached panel and mark it as most recently used."""
+    panel = panels.pop(key, None)
+    if panel is not None:
+        panels[key] = panel
+    return panel
+
+
+def store(key, panel):
+    """Add panel to the cache and evict least recently used panels."""
+    remove(key)
+    panels[key] = panel
+    evict()
+
+
+def remove(key):
+    """Remove panel from the cache and release it."""
+    panel = panels.pop(key, None)
+    if panel is not None:
+        panel.release()
+
+
+def evict():
+    """Evict least recently used panels exceeding the cache size."""
+    while len(panels) > cacheSize():
+        remove(next(iter(panels)))
+
+
+def purge(settings):
+    """Remove panels created with different settings."""
+    for key in list(panels):
+        if key[1] != settings:
+            remove(key)
+
+
+def invalidate(workbench=None, domain=None, prefix=None):
+    """Remove panels for workbench, panels using the menu domain or
+       panels using any menu domain starting with prefix. Remove all
+       panels if no argument is provided."""
+    for key in list(panels):
+        panel = panels[key]
+        if workbench is None and domain is None and prefix is None:
+            remove(key)
+        elif workbench and panel.workbench == workbench:
+            remove(key)
+        elif domain and domain in panel.domains:
+            remove(key)
+        elif prefix and any(d.startswith(prefix) for d in panel.domains):
+            remove(key)
+        else:
+            pass
@@ -20,31 +20,58 @@
 """Command panel for FreeCAD - Commands."""
 
 
-import os
 from PySide import QtGui
 from PySide import QtCore
 import FreeCADGui as Gui
 import CommandPanelGui as cpg
 import CommandPanelCommon as cpc
+import CommandPanelSettings as cps
+import CommandPanelIcons as icons
+import CommandPanelUsage as usage
 import CommandPanelToolbars as cpt
+import CommandPanelPlan as plan
+import CommandPanelTiming as timing
 import CommandPanelEventFilter as cpef
 
 
 p = cpc.p
 menuList = []
 buttonList = []
+domainList = []
+# Toolbar commands used by the panel, None if toolbars are not used
+toolbarList = None
 currentMenu = None
 mw = Gui.getMainWindow()
 mapperShow = QtCore.QSignalMapper()
 mapperExpandCollapse = QtCore.QSignalMapper()
-path = os.path.dirname(__file__) + "/Resources/icons/"
 
 
 class CommandButton(QtGui.QToolButton):
-    """Clear currentMenu on button press event."""
+    """Clear currentMenu on button press event. Button signals are
+       connected to the button slots, as connecting many signals to the
+       same Python function gets slower with every connection."""
     def __init__(self):
         super(CommandButton, self).__init__()
 
+    @QtCore.Slot()
+    def onClicked(self):
+        """Record use of the button command. The triggered signal is
+           not used, as it is emitted also when the default action is
+           triggered outside of the panel."""
+        if self.defaultAction():
+            usage.onTriggered(self.defaultAction())
+
+    @QtCore.Slot(QtGui.QAction)
+    def onMenuTriggered(self, action):
+        """Record use of the menu command and set default menu action."""
+        usage.onTriggered(action)
+        onMenuTriggered(action)
+
+    @QtCore.Slot()
+    def onInvoke(self):
+        """Hide or show the invoke menu."""
+        cpg.onInvoke()
+
     def mousePressEvent(self, event):
         """Press event."""
         global currentMenu
@@ -55,17 +82,20 @@ class CommandButton(QtGui.QToolButton):
         """Change event."""
         if event.type() == QtCore.QEvent.EnabledChange:
             if self.icon().isNull():
-                self.setIcon(QtGui.QIcon(":/icons/freecad"))
+                self.setIcon(icons.freecad())
 
         super(CommandButton, self).changeEvent(event)
 
 
-def buttonFactory():
+def buttonFactory(settings=None):
     """Create button and apply the settings."""
+    if settings is None:
+        settings = cps.current()
     btn = CommandButton()
     btn.installEventFilter((cpef.InstallEvent(btn)))
+    btn.clicked.connect(btn.onClicked)
 
-    btnStyle = p.GetString("Style")
+    btnStyle = settings.style
 
     if btnStyle == "Text":
         btn.setToolButtonStyle(QtCore.Qt.ToolButtonTextOnly)
@@ -76,32 +106,40 @@ def buttonFactory():
     else:
         pass
 
-    if p.GetBool("EnableIconSize", 0):
-        iconSize = p.GetInt("IconSize", 16)
+    if settings.iconSize is not None:
+        iconSize = settings.iconSize
         btn.setIconSize(QtCore.QSize(iconSize, iconSize))
 
-    if p.GetBool("EnableButtonWidth", 0):
-        btn.setFixedWidth(p.GetInt("ButtonWidth", 30))
+    if settings.buttonWidth is not None:
+        btn.setFixedWidth(settings.buttonWidth)
 
-    if p.GetBool("EnableButtonHeight", 0):
-        btn.setFixedHeight(p.GetInt("ButtonHeight", 30))
+    if settings.buttonHeight is not None:
+        btn.setFixedHeight(settings.buttonHeight)
 
-    if p.GetBool("EnableFontSize", 0):
+    if settings.fontSize is not None:
         font = btn.font()
-        font.setPointSize(p.GetInt("FontSize", 8))
+        font.setPointSize(settings.fontSize)
         btn.setFont(font)
 
-    if p.GetString("Layout") == "Grid":
+    if settings.layout == "Grid":
         policy = btn.sizePolicy()
         policy.setHorizontalPolicy(QtGui.QSizePolicy.Ignored)
         btn.setSizePolicy(policy)
 
-    if p.GetBool("AutoRaise", 1):
+    if settings.autoRaise:
         btn.setAutoRaise(True)
 
     return btn
 
 
+def findGroup(domain):
+    """Find menu group, timed as findGroup phase."""
+    started = timing.start()
+    g = cpc.findGroup(domain)
+    timing.stop("findGroup", started)
+    return g
+
+
 def clearList(lst):
     """Empty list and delete the items."""
     try:
@@ -116,210 +154,346 @@ def clearList(lst):
             item = None
 
 
-def workbenchButtons(workbench):
-    """Create workbench buttons from command names."""
-    clearList(menuList)
-    clearList(buttonList)
-    tb = False
-    group = None
-    commands = []
-    actions = cpc.actionList()
+def currentPanel(buttons, menus):
+    """Set buttons and menus of the visible panel."""
+    global buttonList
+    global menuList
+    buttonList = buttons
+    menuList = menus
+
+
+def workbenchCommands(workbench):
+    """Typed plan entries of the workbench panel, followed by toolbar
+       commands for workbenches without the default menu. Toolbars are
+       not observed by the parameter observer, so toolbar commands are
+       added to the memoized plan entries here. Menu domains used by
+       the panel are collected in domainList and toolbar commands in
+       toolbarList."""
+    global domainList
+    global toolbarList
+    resolved = plan.resolve(workbench)
+    domainList = list(resolved.domains)
+    entries = list(resolved.entries)
+    toolbarList = None
+    if resolved.toolbars:
+        toolbarList = tuple(cpt.toolbarCommands())
+        entries.extend([plan.Entry("action", cmd, None)
+                        for cmd in toolbarList])
+    return entries
+
+
+def toolbarsChanged(toolbars):
+    """Check if the toolbar commands differ from the toolbar commands
+       used by the panel. Panels not using toolbars are not affected."""
+    return (toolbars is not None and
+            toolbars != tuple(cpt.toolbarCommands()))
+
+
+def commandButton(entry, actions, settings=None):
+    """Create button for the plan entry."""
+    if settings is None:
+        settings = cps.current()
+    started = timing.start()
+    btn = buttonFactory(settings)
+    timing.stop("buttonFactory", started)
+    cmd = entry.key
+    if entry.kind == "collapse":
+        data = ",".join([entry.domain, str(0)])
+        a = QtGui.QAction(btn)
+        a.setData(data)
+        a.setText("Collapse")
+        a.setIcon(icons.resource("CommandPanelCollapse.svg"))
+        a.setToolTip("Collapse menu")
+        btn.setDefaultAction(a)
+        btn.setObjectName("Collapse")
+        mapperExpandCollapse.setMapping(btn, data)
+        btn.clicked.connect(mapperExpandCollapse.map)
+    elif entry.kind == "separator":
+        btn.setEnabled(False)
+        btn.setAutoRaise(True)
+        btn.setObjectName("CPSeparator")
+    elif entry.kind == "spacer":
+        btn.setEnabled(False)
+        btn.setObjectName("CPSpacer")
+    elif entry.kind == "menu" and not entry.domain:
+        menu = QtGui.QMenu(mw)
+        btn.setMenu(menu)
+        btn.setIcon(icons.freecad())
+        # Theme support
+        btn.setObjectName("qt_toolbutton_menubutton")
+        btn.setPopupMode(QtGui.QToolButton
+                         .ToolButtonPopupMode.MenuButtonPopup)
+        btn.setToolTip("Empty menu")
+    elif entry.kind == "menu":
+        started = timing.start()
+        menu = menuButton(entry.domain, btn, actions)
+        timing.stop("menuButton", started)
+        menu.used.connect(btn.onMenuTriggered)
+        btn.setMenu(menu)
+        # Theme support
+        btn.setObjectName("qt_toolbutton_menubutton")
+        btn.setPopupMode(QtGui.QToolButton
+                         .ToolButtonPopupMode.MenuButtonPopup)
+    elif entry.kind == "action" and cmd in actions:
+        btn.setDefaultAction(actions[cmd])
+        if btn.icon().isNull():
+            btn.setIcon(icons.freecad())
+    else:
+        btn = None
 
-    # User
-    if p.GetGroup("User").GetGroup(workbench).GetString("default"):
-        domain = p.GetGroup("User").GetGroup(workbench).GetString("default")
-    # System
-    elif p.GetGroup("System").GetGroup(workbench).GetString("default"):
-        domain = p.GetGroup("System").GetGroup(workbench).GetString("default")
-    # Global default
+    if (btn and
+            btn.icon().isNull() and
+            btn.objectName() not in ["CPSeparator", "CPSpacer"]):
+        btn.setIcon(icons.freecad())
+
+    if btn:
+        btn.entry = entry
+        btn.key = cmd
+        if settings.menu and btn.objectName() != "Collapse":
+            btn.clicked.connect(btn.onInvoke)
+
+    return btn
+
+
+def refreshButton(btn, actions):
+    """Update reused button to the current actions and menu settings.
+       Return False if the button can not be reused, as the command is
+       no longer available or the menu has no available default."""
+    entry = btn.entry
+    cmd = entry.key
+    menu = btn.menu()
+    if isinstance(menu, CommandMenu):
+        g = findGroup(cmd)
+        default = None
+        if g:
+            default = defaultAction(g, actions)
+        if not default:
+            return False
+        menu.clear()
+        menu.populated = False
+        if default is not btn.defaultAction():
+            btn.setDefaultAction(default)
+    elif entry.kind == "action" and cmd not in actions:
+        return False
+    elif entry.kind == "action" and actions[cmd] is not btn.defaultAction():
+        if btn.defaultAction():
+            btn.removeAction(btn.defaultAction())
+        btn.setDefaultAction(actions[cmd])
     else:
-        tb = True
-        domain = "CPMenu.System.GlobalPanel.GlobalDefault"
-
-    group = cpc.findGroup(domain)
-    if group:
-        commands = cpc.splitIndex(group, "commands")
-        commands = globalDefault(commands)
-        commands = expandedMenuCommands(commands)
-    if tb:
-        for cmd in cpt.toolbarCommands():
-            commands.append(cmd)
-    for cmd in commands:
-        btn = buttonFactory()
-        if cmd.startswith("CPCollapse"):
-            domain = cmd.split("CPCollapse", 1)[1]
-            data = ",".join([domain, str(0)])
-            a = QtGui.QAction(btn)
-            a.setData(data)
-            a.setText("Collapse")
-            a.setIcon(QtGui.QIcon(path + "CommandPanelCollapse.svg"))
-            a.setToolTip("Collapse menu")
-            btn.setDefaultAction(a)
-            btn.setObjectName("Collapse")
-            mapperExpandCollapse.setMapping(btn, data)
-            btn.clicked.connect(mapperExpandCollapse.map)
-        elif cmd == "CPSeparator":
-            btn.setEnabled(False)
-            btn.setAutoRaise(True)
-            btn.setObjectName("CPSeparator")
-        elif cmd == "CPSpacer":
-            btn.setEnabled(False)
-            btn.setObjectName("CPSpacer")
-        elif cmd == "CPMenu":
-            menu = QtGui.QMenu(mw)
-            btn.setMenu(menu)
-            btn.setIcon(QtGui.QIcon(":/icons/freecad"))
-            # Theme support
-            btn.setObjectName("qt_toolbutton_menubutton")
-            btn.setPopupMode(QtGui.QToolButton
-                             .ToolButtonPopupMode.MenuButtonPopup)
-            btn.setToolTip("Empty menu")
-        elif cmd.startswith("CPMenu"):
-            menu = menuButton(cmd, btn, actions)
-            btn.setMenu(menu)
-            # Theme support
-            btn.setObjectName("qt_toolbutton_menubutton")
-            btn.setPopupMode(QtGui.QToolButton
-                             .ToolButtonPopupMode.MenuButtonPopup)
-        elif cmd in actions:
-            btn.setDefaultAction(actions[cmd])
-            if btn.icon().isNull():
-                btn.setIcon(QtGui.QIcon(":/icons/freecad"))
-        else:
-            btn = None
+        pass
 
-        if (btn and
-                btn.icon().isNull() and
-                btn.objectName() not in ["CPSeparator", "CPSpacer"]):
-            btn.setIcon(QtGui.QIcon(":/icons/freecad"))
+    if (btn.icon().isNull() and
+            btn.objectName() not in ["CPSeparator", "CPSpacer"]):
+        btn.setIcon(icons.freecad())
 
-        if not btn:
-            pass
-        elif (p.GetString("Layout") == "Grid" and
-              btn.objectName() == "CPSpacer"):
-            pass
-        else:
-            buttonList.append(btn)
-    if p.GetBool("Menu", 0):
-        for b in buttonList:
-            if b.objectName() != "Collapse":
-                b.clicked.connect(cpg.onInvoke)
-    for m in menuList:
-        m.triggered.connect(onMenuTriggered)
+    return True
 
-    return buttonList
 
+def panelMenus(buttons):
+    """Menus of the buttons."""
+    return [btn.menu() for btn in buttons if btn.menu()]
 
-def globalDefault(commands):
-    """Add commands from global default menu."""
-    temp = []
-    for cmd in commands:
-        if cmd == "CPGlobalDefault":
-            domain = "CPMenu.System.GlobalPanel.GlobalDefault"
-            group = cpc.findGroup(domain)
-            if group:
-                for cmdGlobal in cpc.splitIndex(group, "commands"):
-                    temp.append(cmdGlobal)
-        else:
-            temp.append(cmd)
 
-    return temp
+def workbenchButtons(workbench, commands=None):
+    """Create workbench buttons from plan entries."""
+    global buttonList
+    global menuList
+    buttonList = []
+    started = timing.start()
+    actions = cpc.actionList()
+    timing.stop("actionList", started)
+    settings = cps.current()
+    if commands is None:
+        commands = workbenchCommands(workbench)
+    started = timing.start()
+    for entry in commands:
+        btn = commandButton(entry, actions, settings)
+        if btn:
+            buttonList.append(btn)
+    menuList = panelMenus(buttonList)
+    timing.stop("buttons", started)
+
+    return buttonList
 
 
-def menuButton(domain, btn, actions):
-    """Create menu for menu button."""
-    menu = QtGui.QMenu(mw)
-    menuList.append(menu)
-    menu.setObjectName(domain)
-    g = cpc.findGroup(domain)
-    if g:
-        commands = cpc.splitIndex(g, "commands")
-        for cmd in commands:
+def updateButtons(buttons, commands):
+    """Update buttons to the workbench plan entries. Existing buttons
+       are reused, only missing buttons are created. Return new list of
+       buttons and list of buttons no longer used."""
+    reuse = {}
+    for btn in buttons:
+        reuse.setdefault(btn.entry, []).append(btn)
+    started = timing.start()
+    actions = cpc.actionList()
+    timing.stop("actionList", started)
+    settings = cps.current()
+    result = []
+    unused = []
+    for entry in commands:
+        btn = None
+        if reuse.get(entry):
+            btn = reuse[entry].pop(0)
+            if not refreshButton(btn, actions):
+                unused.append(btn)
+                btn = None
+        if not btn:
+            btn = commandButton(entry, actions, settings)
+        if btn:
+            result.append(btn)
+    for lst in reuse.values():
+        unused.extend(lst)
+
+    return result, unused
+
+
+class UsedMenu(QtGui.QMenu):
+    """Menu emitting used for actions triggered from the shown menu.
+       The triggered signal is emitted also for menu actions triggered
+       outside of the menu. Menu is hidden before the action is
+       triggered, the shown flag is cleared after pending events."""
+
+    used = QtCore.Signal(QtGui.QAction)
+
+    def __init__(self, parent=None):
+        super(UsedMenu, self).__init__(parent)
+        self.shown = False
+        self.aboutToShow.connect(self.onShow)
+        self.aboutToHide.connect(self.onHide)
+        self.triggered.connect(self.onTriggered)
+
+    def onShow(self):
+        """Menu is in use."""
+        self.shown = True
+
+    def onHide(self):
+        """Menu is no longer in use after the triggered action."""
+        QtCore.QTimer.singleShot(0, self.onHidden)
+
+    def onHidden(self):
+        """Clear the shown flag if the menu was not shown again."""
+        if not self.isVisible():
+            self.shown = False
+
+    def onTriggered(self, action):
+        """Emit used for actions triggered from the menu."""
+        if self.shown:
+            self.used.emit(action)
+
+
+class CommandMenu(UsedMenu):
+    """Menu populated with actions on first show."""
+    def __init__(self, domain):
+        super(CommandMenu, self).__init__(mw)
+        self.setObjectName(domain)
+        self.populated = False
+        self.aboutToShow.connect(self.populate)
+
+    def populate(self):
+        """Add actions, separators and expand action to the menu."""
+        if self.populated:
+            return
+        self.populated = True
+        domain = self.objectName()
+        g = findGroup(domain)
+        if not g:
+            return
+        actions = cpc.actionList()
+        for cmd in cpc.splitIndex(g, "commands"):
             if cmd.startswith("CPMenu") or cmd.startswith("CPSpacer"):
                 pass
             elif cmd == "CPSeparator":
-                menu.addSeparator()
+                self.addSeparator()
             elif cmd in actions:
-                menu.addAction(actions[cmd])
+                self.addAction(actions[cmd])
             else:
                 pass
-        # Set default action
-        try:
-            btn.setDefaultAction(menu.actions()[0])
-            menu.setDefaultAction(menu.actions()[0])
-        except IndexError:
-            pass
 
-        default = g.GetString("Default")
-        for a in menu.actions():
-            name = a.objectName()
-            if name and name == default:
-                btn.setDefaultAction(a)
-                menu.setDefaultAction(a)
+        default = defaultAction(g, actions)
+        if default:
+            self.setDefaultAction(default)
 
         # Add expand action
         data = ",".join([domain, str(1)])
-        e = QtGui.QAction(menu)
+        e = QtGui.QAction(self)
         e.setText("Expand")
-        e.setIcon(QtGui.QIcon(path + "CommandPanelExpand.svg"))
+        e.setIcon(icons.resource("CommandPanelExpand.svg"))
         e.setToolTip("Expand menu")
         e.setData(data)
 
-        menu.addSeparator()
-        menu.addAction(e)
+        self.addSeparator()
+        self.addAction(e)
 
         mapperExpandCollapse.setMapping(e, data)
         e.triggered.connect(mapperExpandCollapse.map)
 
+
+class FrequentMenu(UsedMenu):
+    """Menu of the most used commands, ordered on every show."""
+    def __init__(self, parent=None):
+        super(FrequentMenu, self).__init__(parent)
+        self.setTitle("Frequent")
+        self.aboutToShow.connect(self.populate)
+
+    def populate(self):
+        """Add most used available commands."""
+        self.clear()
+        actions = cpc.actionList()
+        limit = max(p.GetInt("FrequentNumber", 10), 1)
+        names = [n for n in usage.frequent() if n in actions][:limit]
+        for name in names:
+            self.addAction(actions[name])
+        if not names:
+            a = self.addAction("No commands used yet")
+            a.setEnabled(False)
+
+
+def defaultAction(group, actions):
+    """Default action for menu, without creating the menu. Use action
+       stored as menu default, the most used or the first available
+       action."""
+    started = timing.start()
+    result = None
+    available = []
+    default = group.GetString("Default")
+    for cmd in cpc.splitIndex(group, "commands"):
+        if (cmd.startswith("CPMenu") or
+                cmd.startswith("CPSpacer") or
+                cmd == "CPSeparator"):
+            pass
+        elif cmd in actions:
+            if cmd == default:
+                result = actions[cmd]
+                break
+            available.append(cmd)
+    if not result and available:
+        used = usage.frequent(available, 1)
+        if used:
+            result = actions[used[0]]
+        else:
+            result = actions[available[0]]
+    timing.stop("defaultAction", started)
+    return result
+
+
+def menuButton(domain, btn, actions):
+    """Create menu for menu button. Menu actions are added on first
+       show, only the default action is resolved now."""
+    menu = CommandMenu(domain)
+    g = findGroup(domain)
+    if g:
+        default = defaultAction(g, actions)
+        if default:
+            btn.setDefaultAction(default)
+
         mapperShow.setMapping(menu, domain)
         menu.aboutToShow.connect(mapperShow.map)
 
     if btn.icon().isNull():
-        btn.setIcon(QtGui.QIcon(":/icons/freecad"))
+        btn.setIcon(icons.freecad())
 
     return menu
 
 
-def expandedMenuCommands(commands):
-    """Add command names for expanded menu."""
-    names = []
-    for cmd in commands:
-        if cmd.startswith("CPMenu"):
-            g = cpc.findGroup(cmd)
-            if g:
-                expand = g.GetBool("Expand", False)
-            else:
-                expand = False
-            if expand:
-                commandsEx = cpc.splitIndex(g, "commands")
-                for cmdEx in commandsEx:
-                    if cmdEx.startswith("CPMenu"):
-                        pass
-                    elif cmdEx == "CPSeparator":
-                        pass
-                    else:
-                        names.append(cmdEx)
-                # Move spacer after collapse button
-                try:
-                    last = names.pop()
-                except IndexError:
-                    last = None
-                if last == "CPSpacer":
-                    names.append("CPCollapse" + cmd)
-                    names.append(last)
-                elif last:
-                    names.append(last)
-                    names.append("CPCollapse" + cmd)
-                else:
-                    names.append("CPCollapse" + cmd)
-            else:
-                names.append(cmd)
-        else:
-            names.append(cmd)
-
-    return names
-
-
 def onMenuShow(domain):
     """Set currentMenu domain on menu aboutToShow"""
     global currentMenu
@@ -338,7 +512,7 @@ def onMenuTriggered(a):
                     if btn.menu() == menu:
                         btn.setDefaultAction(a)
                         if btn.icon().isNull():
-                            btn.setIcon(QtGui.QIcon(":/icons/freecad"))
+                            btn.setIcon(icons.freecad())
                 name = a.objectName()
                 if group and name:
                     group.SetString("Default", name)
@@ -365,7 +539,7 @@ def onMenuExpandCollapse(s):
     else:
         pass
 
-    cpg.onWorkbench()
+    cpg.scheduleUpdate()
 
 
 mapperShow.mapped[str].connect(onMenuShow)
@@ -20,73 +20,395 @@
 """Command panel for FreeCAD - Common."""
 
 
+import time
 import uuid
+import heapq
 import FreeCADGui as Gui
 import FreeCAD as App
 from PySide import QtGui
+from PySide import QtCore
+import CommandPanelIcons as icons
 
 
 mw = Gui.getMainWindow()
 p = App.ParamGet("User parameter:BaseApp/CommandPanel")
+# Start of the command panel import, used for startup timings
+loaded = time.time()
 
 
-def actionList():
-    """Create a dictionary of unique actions. Exclude command names
-       containing . to prevent domain name system clash. Exclude
+registry = {}
+candidates = {}
+owners = {}
+# Main window, toolbars and menus with added children
+pending = []
+# Toolbars and menus with added actions
+changed = []
+removed = []
+generation = 0
+scanned = False
+
+
+def actionFilter(action):
+    """Check if action is eligible for the registry. Exclude command
+       names containing . to prevent domain name system clash. Exclude
        command names containing , to prevent possible join and split
        related issues. Exclude actions with no text, as that can
        result in ambiguity, when selecting the command."""
-    actions = {}
-    duplicates = []
-    for i in mw.findChildren(QtGui.QAction):
-        name = i.objectName()
-        if (name and
-                i.text() and
-                "." not in name and
-                "," not in name):
-            if name in actions:
-                if name not in duplicates:
-                    duplicates.append(name)
+    name = action.objectName()
+    if (name and
+            action.text() and
+            "." not in name and
+            "," not in name):
+        return name
+    return None
+
+
+def updateName(name):
+    """Apply the uniqueness rule for the command name."""
+    global generation
+    lst = candidates.get(name, [])
+    if len(lst) == 1:
+        if registry.get(name) is not lst[0]:
+            registry[name] = lst[0]
+            generation += 1
+    elif name in registry:
+        del registry[name]
+        generation += 1
+
+
+def registerAction(action):
+    """Add action to the registry candidates."""
+    if id(action) in owners:
+        return
+    name = actionFilter(action)
+    if name:
+        owners[id(action)] = name
+        candidates.setdefault(name, []).append(action)
+        updateName(name)
+
+
+def unregisterAction(action):
+    """Remove action from the registry candidates."""
+    name = owners.pop(id(action), None)
+    if name:
+        lst = candidates[name]
+        lst.remove(action)
+        if not lst:
+            del candidates[name]
+        updateName(name)
+
+
+def pruneActions():
+    """Remove actions with deleted underlying objects."""
+    for name in list(candidates):
+        for a in list(candidates[name]):
+            try:
+                a.objectName()
+            except RuntimeError:
+                unregisterAction(a)
+
+
+def scanActions(obj):
+    """Register actions of the object and its children."""
+    if isinstance(obj, QtGui.QAction):
+        registerAction(obj)
+    for i in obj.findChildren(QtGui.QAction):
+        registerAction(i)
+
+
+def watchActions(obj):
+    """Watch toolbars and menus of the object tree for added actions and
+       children. Every widget is watched once."""
+    widgets = obj.findChildren(QtGui.QWidget)
+    if isinstance(obj, QtGui.QWidget):
+        widgets.append(obj)
+    for w in widgets:
+        if (isinstance(w, (QtGui.QToolBar, QtGui.QMenu, QtGui.QMenuBar)) and
+                not w.property("CommandPanelActions")):
+            w.setProperty("CommandPanelActions", True)
+            w.installEventFilter(actionEvent)
+
+
+def scanChildren():
+    """Register main window child actions and scan main window children
+       not scanned before. Only direct children of the main window are
+       visited, changes inside toolbars and menus are reported by their
+       own events."""
+    for child in mw.children():
+        if isinstance(child, QtGui.QAction):
+            registerAction(child)
+        elif not child.property("CommandPanelScanned"):
+            child.setProperty("CommandPanelScanned", True)
+            scanActions(child)
+            watchActions(child)
+        else:
+            pass
+
+
+def scanContainer(obj):
+    """Register actions of the toolbar or menu children."""
+    scanActions(obj)
+    watchActions(obj)
+
+
+def processPending():
+    """Apply queued child removed events, scan the main window, toolbars
+       and menus with added children and register actions of toolbars
+       and menus with added actions."""
+    prune = False
+    while removed:
+        obj = removed.pop(0)
+        if id(obj) in owners:
+            unregisterAction(obj)
+        else:
+            prune = True
+    if prune:
+        pruneActions()
+    while pending:
+        obj = pending.pop(0)
+        try:
+            if obj is mw:
+                scanChildren()
             else:
-                actions[name] = i
-    for d in duplicates:
-        del actions[d]
-    return actions
+                scanContainer(obj)
+        except RuntimeError:
+            pass
+    while changed:
+        obj = changed.pop(0)
+        try:
+            for a in obj.actions():
+                registerAction(a)
+        except RuntimeError:
+            pass
 
 
-def wbIcon(i):
-    """Create workbench icon."""
-    if str(i.find("XPM")) != "-1":
-        icon = []
-        for a in ((((i
-                     .split('{', 1)[1])
-                    .rsplit('}', 1)[0])
-                   .strip())
-                  .split("\n")):
-            icon.append((a
-                         .split('"', 1)[1])
-                        .rsplit('"', 1)[0])
-        icon = QtGui.QIcon(QtGui.QPixmap(icon))
+def invalidateActions():
+    """Force full rescan of main window actions on next request."""
+    global scanned
+    global generation
+    scanned = False
+    registry.clear()
+    candidates.clear()
+    owners.clear()
+    del pending[:]
+    del changed[:]
+    del removed[:]
+    generation += 1
+
+
+def actionList():
+    """Dictionary of unique actions. Registry is built once and then
+       updated from child and action events of the main window, its
+       toolbars and menus. Returned dictionary is shared and should not
+       be modified."""
+    global scanned
+    if not scanned:
+        scanned = True
+        del pending[:]
+        del changed[:]
+        del removed[:]
+        scanActions(mw)
+        watchActions(mw)
+        for child in mw.children():
+            child.setProperty("CommandPanelScanned", True)
     else:
-        icon = QtGui.QIcon(QtGui.QPixmap(i))
-    if icon.isNull():
-        icon = QtGui.QIcon(":/icons/freecad")
-    return icon
+        processPending()
+    return registry
+
+
+def findAction(name):
+    """Find registered action by command name."""
+    return actionList().get(name)
+
+
+def actionGeneration():
+    """Registry generation, incremented on every registry change."""
+    actionList()
+    return generation
+
+
+class ActionEvent(QtCore.QObject):
+    """Queue main window, toolbar and menu events for the action
+       registry. The object with added children or actions is queued,
+       as the wrapper of the added child is not usable until the child
+       is constructed and the added action is not available from
+       PySide2 action events."""
+    def eventFilter(self, obj, event):
+        """Child added, child removed and action added events."""
+        t = event.type()
+        if not scanned:
+            pass
+        elif t == QtCore.QEvent.ChildAdded:
+            if obj not in pending:
+                pending.append(obj)
+        elif t == QtCore.QEvent.ActionAdded:
+            if obj not in changed:
+                changed.append(obj)
+        elif t == QtCore.QEvent.ChildRemoved:
+            removed.append(event.child())
+        else:
+            pass
+
+        return QtCore.QObject.eventFilter(self, obj, event)
+
+
+actionEvent = ActionEvent()
+mw.installEventFilter(actionEvent)
+
+
+def xpmLines(i):
+    """Quoted strings of the inline XPM icon, in a single pass over the
+       XPM body. Comments and line endings between strings are
+       skipped."""
+    lines = []
+    start = i.find("{") + 1
+    end = i.rfind("}")
+    if start == 0 or end < start:
+        return lines
+    first = i.find('"', start, end)
+    while first != -1:
+        last = i.find('"', first + 1, end)
+        if last == -1:
+            break
+        lines.append(i[first + 1:last])
+        first = i.find('"', last + 1, end)
+    return lines
+
+
+def wbIcon(i):
+    """Create workbench icon. Icons are decoded once per distinct
+       inline XPM icon or file path."""
+    def factory():
+        if "XPM" in i:
+            icon = QtGui.QIcon(QtGui.QPixmap(xpmLines(i)))
+        else:
+            icon = QtGui.QIcon(QtGui.QPixmap(i))
+        if icon.isNull():
+            icon = icons.freecad()
+        return icon
+    return icons.cached(("wbIcon", i), factory)
+
+
+groupIndex = {}
+groupHooks = []
+groupSlots = {}
+# Menu group handles by workbench and slot
+groupHandles = {}
+mutating = 0
+# Parameter setters by GetContents type, used when groups are compacted
+groupSetters = {"String": "SetString",
+                "Boolean": "SetBool",
+                "Integer": "SetInt",
+                "Float": "SetFloat",
+                "Unsigned Long": "SetUnsigned"}
+
+
+class SlotAllocator(object):
+    """Used and free menu group slots of the workbench group. Freed
+       slots are reused first (lowest first), new slots follow the
+       highest used slot. Only the holes below it are kept as free."""
+    def __init__(self, index):
+        self.used = set()
+        for i in index:
+            try:
+                self.used.add(int(i))
+            except ValueError:
+                pass
+        self.free = []
+        self.next = 1
+        for x in sorted(self.used):
+            if x > self.next:
+                self.free.extend(range(self.next, x))
+            self.next = max(self.next, x + 1)
+
+    def allocate(self):
+        """Return free slot name."""
+        if self.free:
+            x = heapq.heappop(self.free)
+        else:
+            x = self.next
+            self.next += 1
+        self.used.add(x)
+        return str(x)
+
+    def release(self, slot):
+        """Mark slot as free."""
+        try:
+            x = int(slot)
+        except ValueError:
+            return
+        if x in self.used:
+            self.used.remove(x)
+            heapq.heappush(self.free, x)
+
+
+def slotAllocator(source, workbench):
+    """Cached slot allocator for workbench group."""
+    key = (source, workbench)
+    try:
+        return groupSlots[key]
+    except KeyError:
+        base = p.GetGroup(source).GetGroup(workbench)
+        groupSlots[key] = SlotAllocator(splitIndex(base))
+        return groupSlots[key]
+
+
+def runHooks(source, workbench, index):
+    """Notify hooks about known menu groups (uuid and group name)."""
+    for hook in groupHooks:
+        hook(source, workbench, index)
+
+
+def domainIndex(source, workbench):
+    """Cached dictionary of menu uuid and group name for workbench."""
+    key = (source, workbench)
+    try:
+        return groupIndex[key]
+    except KeyError:
+        index = {}
+        handles = {}
+        base = p.GetGroup(source).GetGroup(workbench)
+        for i in splitIndex(base):
+            handles[i] = base.GetGroup(i)
+            index[handles[i].GetString("uuid")] = i
+        groupIndex[key] = index
+        groupHandles[key] = handles
+        runHooks(source, workbench, index)
+        return index
+
+
+def invalidateIndex(source=None, workbench=None):
+    """Invalidate cached domain index, group handles and slot
+       allocators."""
+    for cache in [groupIndex, groupHandles, groupSlots]:
+        for key in list(cache):
+            if ((source is None or key[0] == source) and
+                    (workbench is None or key[1] == workbench)):
+                del cache[key]
 
 
 def defaultGroup(base):
     """Create default group if no group exist."""
+    global mutating
     g = None
     index = base.GetString("index")
     if not index:
-        base.SetString("index", "1")
-        g = base.GetGroup("1")
-        g.SetString("uuid", str(uuid.uuid4()))
-        g.SetString("name", "Default")
-        cmd = ["Std_ViewFront",
-               "Std_ViewTop",
-               "Std_ViewRight"]
-        g.SetString("commands", ",".join(cmd))
+        mutating += 1
+        try:
+            base.SetString("index", "1")
+            g = base.GetGroup("1")
+            g.SetString("uuid", str(uuid.uuid4()))
+            g.SetString("name", "Default")
+            cmd = ["Std_ViewFront",
+                   "Std_ViewTop",
+                   "Std_ViewRight"]
+            g.SetString("commands", ",".join(cmd))
+        finally:
+            mutating -= 1
+        try:
+            invalidateIndex(workbench=base.GetGroupName())
+        except AttributeError:
+            invalidateIndex()
     return g
 
 
@@ -138,11 +460,14 @@ def findGroup(domain):
     d = splitDomain(domain)
     if all(d):
         prefix, source, workbench, uid = d
-        base = p.GetGroup(source).GetGroup(workbench)
-        index = splitIndex(base)
-        for i in index:
-            if base.GetGroup(i).GetString("uuid") == uid:
-                g = base.GetGroup(i)
+        i = domainIndex(source, workbench).get(uid)
+        if i:
+            handles = groupHandles.setdefault((source, workbench), {})
+            try:
+                g = handles[i]
+            except KeyError:
+                g = p.GetGroup(source).GetGroup(workbench).GetGroup(i)
+                handles[i] = g
     return g
 
 
@@ -152,32 +477,97 @@ def newGroup(domain):
     d = splitDomain(domain)
     if all(d):
         prefix, source, workbench, uid = d
-        base = p.GetGroup(source).GetGroup(workbench)
-        index = splitIndex(base)
-        x = 1
-        while str(x) in index and x < 1000:
-            x += 1
-        index.append(str(x))
-        base.SetString("index", ",".join(index))
-        g = base.GetGroup(str(x))
-        g.SetString("uuid", uid)
+        g = newGroups(source, workbench, [uid]).get(uid)
     return g
 
 
+def newGroups(source, workbench, uids):
+    """Create new groups for the menu uuids. Workbench index is written
+       once. Return dictionary of menu uuid and group."""
+    global mutating
+    groups = {}
+    if not uids:
+        return groups
+    base = p.GetGroup(source).GetGroup(workbench)
+    index = splitIndex(base)
+    slots = slotAllocator(source, workbench)
+    added = {}
+    # New groups are not in use until the index is written
+    mutating += 1
+    try:
+        for uid in uids:
+            slot = slots.allocate()
+            index.append(slot)
+            g = base.GetGroup(slot)
+            g.SetString("uuid", uid)
+            groups[uid] = g
+            added[uid] = slot
+        base.SetString("index", ",".join(index))
+    finally:
+        mutating -= 1
+    domainIndex(source, workbench).update(added)
+    handles = groupHandles.setdefault((source, workbench), {})
+    for uid, slot in added.items():
+        handles[slot] = groups[uid]
+    runHooks(source, workbench, added)
+    return groups
+
+
 def deleteGroup(domain):
     """Delete group matching the domain name."""
     d = splitDomain(domain)
     if all(d):
-        temp = []
         prefix, source, workbench, uid = d
         base = p.GetGroup(source).GetGroup(workbench)
-        index = splitIndex(base)
-        for i in index:
-            if base.GetGroup(i).GetString("uuid") == uid:
-                base.RemGroup(i)
-            else:
-                temp.append(i)
-        base.SetString("index", ",".join(temp))
+        i = domainIndex(source, workbench).pop(uid, None)
+        if i:
+            index = splitIndex(base)
+            groupHandles.get((source, workbench), {}).pop(i, None)
+            base.RemGroup(i)
+            if i in index:
+                index.remove(i)
+            slotAllocator(source, workbench).release(i)
+            base.SetString("index", ",".join(index))
         defaultGroup(base)
         return True
     return False
+
+
+def groupContents(g):
+    """Parameters and subgroups of the group."""
+    return (g.GetContents() or [],
+            [(i, groupContents(g.GetGroup(i))) for i in g.GetGroups()])
+
+
+def restoreGroup(g, contents):
+    """Write parameters and subgroups from groupContents to the group."""
+    values, groups = contents
+    for kind, name, value in values:
+        getattr(g, groupSetters[kind])(name, value)
+    for i, sub in groups:
+        restoreGroup(g.GetGroup(i), sub)
+
+
+def compactGroups(source, workbench):
+    """Renumber menu groups of the workbench to slots 1 to n, keeping
+       the menu order and group contents. Return True if groups were
+       moved."""
+    global mutating
+    base = p.GetGroup(source).GetGroup(workbench)
+    index = splitIndex(base)
+    target = [str(x) for x in range(1, len(index) + 1)]
+    if index == target:
+        return False
+    contents = [groupContents(base.GetGroup(i)) for i in index]
+    mutating += 1
+    try:
+        for i in index:
+            base.RemGroup(i)
+        for i, c in zip(target, contents):
+            restoreGroup(base.GetGroup(i), c)
+        base.SetString("index", ",".join(target))
+    finally:
+        mutating -= 1
+    invalidateIndex(source, workbench)
+    domainIndex(source, workbench)
+    return True
@@ -48,10 +48,39 @@
 
 from PySide import QtGui
 from PySide import QtCore
-import CommandPanelCommon as cpc
-
-
-p = cpc.p
+import CommandPanelSettings as cps
+import CommandPanelTiming as timing
+
+
+def flowRects(metrics, rect, space):
+    """Item rectangles (x, y, width, height) and total height for
+       flow layout of item metrics (width, height, spacer)."""
+    rects = []
+    x = rect.x()
+    y = rect.y()
+    right = rect.right()
+    lineHeight = 0
+
+    for width, height, spacer in metrics:
+        nextX = x + width + space
+        if nextX - space > right and lineHeight > 0:
+            x = rect.x()
+            y = y + lineHeight + space
+            nextX = x + width + space
+            lineHeight = 0
+        elif spacer:
+            x = rect.x()
+            y = y + lineHeight + space
+            nextX = x + width
+            lineHeight = 0
+        else:
+            pass
+
+        rects.append((x, y, width, height))
+        x = nextX
+        lineHeight = max(lineHeight, height)
+
+    return rects, y + lineHeight - rect.y()
 
 
 class FlowLayout(QtGui.QLayout):
@@ -65,7 +94,12 @@ class FlowLayout(QtGui.QLayout):
 
         self.itemList = []
 
-        self.spaceXY = p.GetInt("ButtonSpacing", 5)
+        # Cached item metrics, height for width and minimum size
+        self.metrics = None
+        self.heights = {}
+        self.minSize = None
+
+        self.spaceXY = cps.current().spacing
 
     def __del__(self):
         item = self.takeAt(0)
@@ -73,10 +107,24 @@ class FlowLayout(QtGui.QLayout):
             item = self.takeAt(0)
 
     def setSpaceXY(self):
-        self.spaceXY = p.GetInt("ButtonSpacing", 5)
+        self.spaceXY = cps.current().spacing
+        self.invalidate()
+
+    def clearCache(self):
+        self.metrics = None
+        self.heights = {}
+        self.minSize = None
+
+    def invalidate(self):
+        self.clearCache()
+        super(FlowLayout, self).invalidate()
 
     def addItem(self, item):
+        wid = item.widget()
+        if wid and wid.objectName() == "CPSpacer":
+            wid.setFixedSize(0, 0)
         self.itemList.append(item)
+        self.clearCache()
 
     def count(self):
         return len(self.itemList)
@@ -89,6 +137,7 @@ class FlowLayout(QtGui.QLayout):
 
     def takeAt(self, index):
         if index >= 0 and index < len(self.itemList):
+            self.clearCache()
             return self.itemList.pop(index)
 
         return None
@@ -100,8 +149,12 @@ class FlowLayout(QtGui.QLayout):
         return True
 
     def heightForWidth(self, width):
-        height = self.doLayout(QtCore.QRect(0, 0, width, 0), True)
-        return height
+        try:
+            return self.heights[width]
+        except KeyError:
+            height = self.doLayout(QtCore.QRect(0, 0, width, 0), True)
+            self.heights[width] = height
+            return height
 
     def setGeometry(self, rect):
         super(FlowLayout, self).setGeometry(rect)
@@ -111,42 +164,35 @@ class FlowLayout(QtGui.QLayout):
         return self.minimumSize()
 
     def minimumSize(self):
-        size = QtCore.QSize()
+        if self.minSize is None:
+            size = QtCore.QSize()
+
+            for item in self.itemList:
+                size = size.expandedTo(item.minimumSize())
+
+            size += QtCore.QSize(2 * self.contentsMargins().top(),
+                                 2 * self.contentsMargins().top())
+            self.minSize = size
+        return QtCore.QSize(self.minSize)
+
+    def itemMetrics(self):
+        # Size hint and spacer flag for every item
+        if self.metrics is None:
+            self.metrics = []
+            for item in self.itemList:
+                wid = item.widget()
+                spacer = bool(wid and wid.objectName() == "CPSpacer")
+                hint = item.sizeHint()
+                self.metrics.append((hint.width(), hint.height(), spacer))
+        return self.metrics
 
-        for item in self.itemList:
-            size = size.expandedTo(item.minimumSize())
+    def doLayout(self, rect, testOnly):
+        started = timing.start()
+        rects, height = flowRects(self.itemMetrics(), rect, self.spaceXY)
 
-        size += QtCore.QSize(2 * self.contentsMargins().top(),
-                             2 * self.contentsMargins().top())
-        return size
+        if not testOnly:
+            for item, r in zip(self.itemList, rects):
+                item.setGeometry(QtCore.QRect(*r))
 
-    def doLayout(self, rect, testOnly):
-        x = rect.x()
-        y = rect.y()
-        lineHeight = 0
-
-        for item in self.itemList:
-            wid = item.widget()
-            nextX = x + item.sizeHint().width() + self.spaceXY
-            if nextX - self.spaceXY > rect.right() and lineHeight > 0:
-                x = rect.x()
-                y = y + lineHeight + self.spaceXY
-                nextX = x + item.sizeHint().width() + self.spaceXY
-                lineHeight = 0
-            elif wid.objectName() == "CPSpacer":
-                wid.setFixedSize(0, 0)
-                x = rect.x()
-                y = y + lineHeight + self.spaceXY
-                nextX = x + item.sizeHint().width()
-                lineHeight = 0
-            else:
-                pass
-
-            if not testOnly:
-                item.setGeometry(QtCore.QRect(QtCore.QPoint(x, y),
-                                              item.sizeHint()))
-
-            x = nextX
-            lineHeight = max(lineHeight, item.sizeHint().height())
-
-        return y + lineHeight - rect.y()
+        timing.stop("layout", started)
+        return height
@@ -89,19 +89,12 @@ GlobalStructure = {
     "commands": GlobalStructureCmd}
 
 
-GlobalFileDomain = cp.addMenu(GlobalFile)
-GlobalViewDomain = cp.addMenu(GlobalView)
-GlobalDrawStyleDomain = cp.addMenu(GlobalDrawStyle)
-GlobalMacroDomain = cp.addMenu(GlobalMacro)
-GlobalStructureDomain = cp.addMenu(GlobalStructure)
-
-
 GlobalDefaultCmd = [
-    GlobalFileDomain,
-    GlobalViewDomain,
-    GlobalDrawStyleDomain,
-    GlobalMacroDomain,
-    GlobalStructureDomain]
+    GlobalFile,
+    GlobalView,
+    GlobalDrawStyle,
+    GlobalMacro,
+    GlobalStructure]
 
 
 GlobalDefault = {
@@ -112,4 +105,14 @@ GlobalDefault = {
     "default": True}
 
 
-cp.addMenu(GlobalDefault)
+(GlobalFileDomain,
+ GlobalViewDomain,
+ GlobalDrawStyleDomain,
+ GlobalMacroDomain,
+ GlobalStructureDomain,
+ GlobalDefaultDomain) = cp.addMenus([GlobalFile,
+                                     GlobalView,
+                                     GlobalDrawStyle,
+                                     GlobalMacro,
+                                     GlobalStructure,
+                                     GlobalDefault])
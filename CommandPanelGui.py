@@ -20,18 +20,28 @@
 """Command panel for FreeCAD - Gui."""
 
 
+import time
 from PySide import QtGui
 from PySide import QtCore
 import FreeCAD as App
 import FreeCADGui as Gui
+import CommandPanel as cp
 import CommandPanelCommon as cpc
+import CommandPanelCache as cache
+import CommandPanelIcons as icons
+import CommandPanelObserver as cpo
+import CommandPanelSettings as cps
 import CommandPanelCommands as cpcmd
-import CommandPanelPreferences as cpp
 import CommandPanelFlowLayout as flow
+import CommandPanelVirtual as virtual
+import CommandPanelUsage as usage
+import CommandPanelTiming as timing
 
 
 p = cpc.p
-layout = None
+panel = None
+rebuilds = {"requested": 0, "executed": 0}
+startup = {}
 mw = Gui.getMainWindow()
 
 widget = QtGui.QWidget()
@@ -47,59 +57,78 @@ scroll.setWidget(widget)
 dock = QtGui.QDockWidget()
 dock.setWindowTitle("Commands")
 dock.setObjectName("CommandPanel")
+dockWidget = QtGui.QWidget()
+layoutDock = QtGui.QVBoxLayout()
+layoutDock.setContentsMargins(0, 0, 0, 0)
+dockWidget.setLayout(layoutDock)
 
 invokeMenu = QtGui.QMenu(mw)
 invokeMenu.hide()
 widgetAction = QtGui.QWidgetAction(invokeMenu)
 
+commandPalette = None
+popup = QtGui.QWidget()
+layoutPopup = QtGui.QVBoxLayout()
+layoutPopup.setContentsMargins(0, 0, 0, 0)
+popup.setLayout(layoutPopup)
+
 
 # Layouts
 layoutGlobal = QtGui.QVBoxLayout()
 widget.setLayout(layoutGlobal)
 
-layoutFlow = flow.FlowLayout()
-layoutGrid = QtGui.QGridLayout()
-
-layoutStretch = QtGui.QVBoxLayout()
-layoutStretch.addStretch()
-
-layoutGlobal.insertLayout(0, layoutFlow)
-layoutGlobal.insertLayout(1, layoutGrid)
-layoutGlobal.insertLayout(2, layoutStretch)
-
 
-def setLayout():
-    """Use Grid or Flow layout"""
-    global layout
-
-    if p.GetString("Layout") == "Grid":
-        layoutFlow.setEnabled(False)
-        layoutGrid.setEnabled(True)
-        layoutStretch.setEnabled(True)
-        layout = layoutGrid
-    else:
-        layoutGrid.setEnabled(False)
-        layoutStretch.setEnabled(False)
-        layoutFlow.setEnabled(True)
-        layout = layoutFlow
+class Panel(QtGui.QWidget):
+    """Container widget for workbench buttons."""
+    def __init__(self, workbench):
+        super(Panel, self).__init__()
+        self.setContentsMargins(0, 0, 0, 0)
+        self.workbench = workbench
+        self.buttons = []
+        self.menus = []
+        self.domains = set()
+        self.settings = None
+        self.buttonLayout = None
+        self.area = None
+        self.generation = None
+        self.toolbars = None
+        self.released = False
+
+    def release(self):
+        """Release the panel. Visible panel is kept until replaced."""
+        self.released = True
+        if self is not panel:
+            self.discard()
+
+    def discard(self):
+        """Remove panel from the layout and delete it."""
+        self.hide()
+        layoutGlobal.removeWidget(self)
+        cpcmd.clearList(self.menus)
+        self.deleteLater()
 
 
 def setContainer():
     """Use dock or menu as a container."""
-    if p.GetBool("Menu", 0):
+    if cps.current().menu:
         mw.removeDockWidget(dock)
         dock.toggleViewAction().setVisible(False)
-        widgetAction.setDefaultWidget(scroll)
+        layoutDock.removeWidget(scroll)
+        layoutPopup.addWidget(scroll)
+        widgetAction.setDefaultWidget(popup)
         invokeMenu.addAction(widgetAction)
         scroll.setFrameShape(QtGui.QFrame.NoFrame)
     else:
-        dock.setWidget(scroll)
+        layoutPopup.removeWidget(scroll)
+        layoutDock.addWidget(scroll)
+        dock.setWidget(dockWidget)
         mw.addDockWidget(QtCore.Qt.LeftDockWidgetArea, dock)
         dock.toggleViewAction().setVisible(True)
         scroll.setMinimumSize(QtCore.QSize(0, 0))
         scroll.setMaximumSize(QtCore.QSize(16777215, 16777215))
         scroll.setFrameShape(QtGui.QFrame.StyledPanel)
         dock.show()
+    placePalette()
 
 
 def accessoriesMenu():
@@ -134,63 +163,334 @@ def accessoriesMenu():
 
 
 def onPreferences():
-    """Open the preferences dialog."""
+    """Open the preferences dialog. Preferences are imported on first
+       use to keep FreeCAD start fast."""
+    import CommandPanelPreferences as cpp
     cpp.createWidgets()
     dialog = cpp.dialog()
     dialog.show()
 
 
-def onWorkbench():
-    """Populate command panel on workbench activation."""
-
-    # Global panel mode
-    if p.GetBool("Global", 0):
-        workbench = "GlobalPanel"
-    else:
-        workbench = Gui.activeWorkbench().__class__.__name__
-
-    if layout:
-        while not layout.isEmpty():
-            item = layout.takeAt(0)
-            del item
-
-    buttons = cpcmd.workbenchButtons(workbench)
-
-    if p.GetString("Layout") == "Grid":
-        columns = p.GetInt("ColumnNumber", 1) - 1
+def settingsKey():
+    """Settings used when creating the panel buttons."""
+    s = cps.current()
+    return (s.layout,
+            s.columns,
+            s.spacing,
+            s.style,
+            s.autoRaise,
+            s.menu,
+            s.virtual,
+            s.virtualThreshold,
+            s.iconSize,
+            s.buttonWidth,
+            s.buttonHeight,
+            s.fontSize)
+
+
+def layoutButtons(pnl):
+    """Add panel buttons to the panel layout."""
+    lo = pnl.buttonLayout
+    while not lo.isEmpty():
+        item = lo.takeAt(0)
+        del item
+
+    if cps.current().layout == "Grid":
+        columns = cps.current().columns - 1
         x = 0
         y = 0
-        for btn in buttons:
+        for btn in pnl.buttons:
             if y > columns:
                 y = 0
                 x += 1
-            layout.addWidget(btn, x, y)
+            lo.addWidget(btn, x, y)
             y += 1
-        # Set spacing
-        layout.setSpacing(p.GetInt("ButtonSpacing", 5))
     else:
-        for btn in buttons:
-            layout.addWidget(btn)
-        # Set spacing
-        layout.setSpaceXY()
-        layout.update()
+        for btn in pnl.buttons:
+            lo.addWidget(btn)
+
+
+def createPanel(workbench, settings):
+    """Create panel with workbench buttons."""
+    pnl = Panel(workbench)
+    pnl.settings = settings
+    lo = QtGui.QVBoxLayout()
+    lo.setContentsMargins(0, 0, 0, 0)
+    pnl.setLayout(lo)
+
+    started = timing.start()
+    commands = cpcmd.workbenchCommands(workbench)
+    timing.stop("plan", started)
+
+    if virtual.isVirtual(len(commands)):
+        pnl.area = virtual.VirtualArea(scroll, commands)
+        pnl.buttons = pnl.area.buttons
+        pnl.menus = pnl.area.menus
+        lo.addWidget(pnl.area)
+        lo.addStretch()
+    else:
+        if cps.current().layout == "Grid":
+            pnl.buttonLayout = QtGui.QGridLayout()
+            # Set spacing
+            pnl.buttonLayout.setSpacing(cps.current().spacing)
+            lo.addLayout(pnl.buttonLayout)
+            lo.addStretch()
+        else:
+            pnl.buttonLayout = flow.FlowLayout()
+            # Set spacing
+            pnl.buttonLayout.setSpaceXY()
+            lo.addLayout(pnl.buttonLayout)
+        pnl.buttons = cpcmd.workbenchButtons(workbench, commands)
+        pnl.menus = cpcmd.menuList
+        started = timing.start()
+        layoutButtons(pnl)
+        timing.stop("layoutButtons", started)
+
+    pnl.domains = set(cpcmd.domainList)
+    pnl.toolbars = cpcmd.toolbarList
+    pnl.generation = cpc.actionGeneration()
+    pnl.hide()
+    layoutGlobal.addWidget(pnl)
+
+    return pnl
+
+
+def refreshPanel(pnl):
+    """Update panel in place. Existing buttons are reused and layout
+       updates are suppressed until all changes are applied. Return
+       False if the panel needs to be created again."""
+    started = timing.start()
+    commands = cpcmd.workbenchCommands(pnl.workbench)
+    if virtual.isVirtual(len(commands)) != bool(pnl.area):
+        return False
+
+    pnl.setUpdatesEnabled(False)
+    if pnl.area:
+        pnl.area.setKeys(commands)
+    else:
+        pnl.buttonLayout.setEnabled(False)
+
+        buttons, unused = cpcmd.updateButtons(pnl.buttons, commands)
+        for btn in unused:
+            pnl.buttonLayout.removeWidget(btn)
+            btn.hide()
+        menus = cpcmd.panelMenus(unused)
+        cpcmd.clearList(menus)
+        cpcmd.clearList(unused)
+
+        pnl.buttons = buttons
+        pnl.menus = cpcmd.panelMenus(buttons)
+        layoutButtons(pnl)
+
+        pnl.buttonLayout.setEnabled(True)
+        pnl.buttonLayout.invalidate()
+
+    pnl.domains = set(cpcmd.domainList)
+    pnl.toolbars = cpcmd.toolbarList
+    pnl.generation = cpc.actionGeneration()
+    pnl.setUpdatesEnabled(True)
+    pnl.released = False
+    timing.stop("refresh", started)
+
+    return True
+
+
+def onWorkbench():
+    """Populate command panel on workbench activation."""
+    scheduleUpdate()
+    flushUpdate()
+
+
+def scheduleUpdate():
+    """Request panel update. Requests are coalesced into a single
+       update after a short quiet period."""
+    rebuilds["requested"] += 1
+    timerUpdate.start(max(p.GetInt("UpdateDelay", 30), 0))
+
+
+def flushUpdate():
+    """Apply pending panel update immediately."""
+    if timerUpdate.isActive():
+        timerUpdate.stop()
+        updatePanel()
+
+
+def updateStats():
+    """Number of requested and executed panel updates."""
+    return dict(rebuilds)
+
+
+def updatePanel():
+    """Populate command panel. Panels are cached per workbench and
+       settings, and reused on activation. Cached panels are refreshed
+       if actions or toolbar commands used by the panel changed."""
+    global panel
+    rebuilds["executed"] += 1
+
+    # Without parameter observers cached panels can not be trusted
+    if not cpo.observed:
+        cache.invalidate()
+        timing.refresh()
+    started = timing.start()
+
+    active = Gui.activeWorkbench().__class__.__name__
+    cp.activated.add(active)
+
+    # Global panel mode
+    if cps.current().globalPanel:
+        workbench = "GlobalPanel"
+    else:
+        workbench = active
+
+    timing.workbench = workbench
+
+    settings = settingsKey()
+    key = (workbench, settings)
+    cache.purge(settings)
+    current = cache.lookup(key)
+    if (current and
+            (current.generation != cpc.actionGeneration() or
+             cpcmd.toolbarsChanged(current.toolbars)) and
+            not refreshPanel(current)):
+        cache.remove(key)
+        current = None
+    if (not current and
+            panel and
+            panel.released and
+            panel.workbench == workbench and
+            panel.settings == settings and
+            refreshPanel(panel)):
+        current = panel
+        cache.store(key, current)
+    if not current:
+        current = createPanel(workbench, settings)
+        cache.store(key, current)
+
+    if panel is not current:
+        if panel and panel.released:
+            panel.discard()
+        elif panel:
+            panel.hide()
+        else:
+            pass
+        panel = current
+        panel.show()
+    cpcmd.currentPanel(panel.buttons, panel.menus)
+    timing.stop("update", started)
+    if "panel" not in startup:
+        recordStartup("panel")
+
+
+def onParameter(kind, source, workbench, domain, name):
+    """Invalidate cached panels affected by the parameter change and
+       update visible panel if needed. Menu default, name and hash
+       changes do not change the panel, menu buttons update the default
+       action in place."""
+    visible = panel and not panel.released
+    if kind == "setting":
+        if name == "CacheSize":
+            cache.evict()
+        elif name == "IconCacheSize":
+            icons.refresh()
+        elif name in cps.names:
+            scheduleUpdate()
+        else:
+            pass
+    elif kind == "workbench":
+        cache.invalidate(workbench=workbench)
+        if not visible or panel.workbench == workbench:
+            scheduleUpdate()
+    elif kind == "menu" and name in ["commands", "Expand"]:
+        cache.invalidate(domain=domain)
+        if not visible or domain in panel.domains:
+            scheduleUpdate()
+    elif kind == "index":
+        cache.invalidate(workbench=workbench,
+                         prefix=".".join(["CPMenu", source, workbench, ""]))
+        scheduleUpdate()
+    else:
+        pass
 
 
 def onInvoke():
-    """Hide or show command panel at mouse position."""
-    enabled = p.GetBool("Menu", 0)
+    """Hide or show command panel at mouse position. In dock mode show
+       the command palette above the panel."""
+    flushUpdate()
+    s = cps.current()
+    enabled = s.menu
     if enabled and invokeMenu.isVisible():
         invokeMenu.hide()
     elif enabled:
         pos = QtGui.QCursor.pos()
-        invokeMenu.setFixedWidth(p.GetInt("MenuWidth", 300))
-        invokeMenu.setFixedHeight(p.GetInt("MenuHeight", 300))
-        scroll.setFixedWidth(p.GetInt("MenuWidth", 300))
-        scroll.setFixedHeight(p.GetInt("MenuHeight", 300))
+        palette = paletteWidget()
+        palette.reset()
+        invokeMenu.setFixedWidth(s.menuWidth)
+        invokeMenu.setFixedHeight(s.menuHeight)
+        popup.setFixedWidth(s.menuWidth)
+        popup.setFixedHeight(s.menuHeight)
         invokeMenu.popup(QtCore.QPoint(pos.x() - invokeMenu.width() / 2,
                                        pos.y() - invokeMenu.height() / 2))
+        palette.edit.setFocus()
     else:
-        pass
+        palette = paletteWidget()
+        palette.reset()
+        palette.show()
+        dock.show()
+        dock.raise_()
+        palette.edit.setFocus()
+
+
+def onSearching(active):
+    """Show search results instead of the panel while searching."""
+    scroll.setHidden(active)
+
+
+def onTriggered():
+    """Close the invoke menu or the dock palette after a command or menu
+       is triggered from the palette."""
+    invokeMenu.hide()
+    if not cps.current().menu:
+        commandPalette.hide()
+        onSearching(False)
+
+
+def paletteWidget():
+    """Command palette above the panel, created on first use."""
+    global commandPalette
+    if commandPalette is None:
+        import CommandPanelPalette as palette
+        commandPalette = palette.Palette()
+        commandPalette.triggered.connect(onTriggered)
+        commandPalette.searching.connect(onSearching)
+        placePalette()
+    return commandPalette
+
+
+def placePalette():
+    """Move the palette to the current container. The palette is always
+       shown in the invoke menu and shown on invoke in the dock."""
+    if commandPalette is None:
+        return
+    layoutPopup.removeWidget(commandPalette)
+    layoutDock.removeWidget(commandPalette)
+    if cps.current().menu:
+        layoutPopup.insertWidget(0, commandPalette)
+        commandPalette.show()
+    else:
+        layoutDock.insertWidget(0, commandPalette)
+        commandPalette.hide()
+
+
+def recordStartup(name):
+    """Record startup phase time in milliseconds since import."""
+    startup[name] = round((time.time() - cpc.loaded) * 1000, 1)
+    App.Console.PrintLog("Command panel startup: " +
+                         name + " " + str(startup[name]) + " ms\n")
+
+
+def startupTimes():
+    """Startup phase times in milliseconds since import."""
+    return dict(startup)
 
 
 def onStart():
@@ -202,9 +502,11 @@ def onStart():
         start = True
     except AttributeError:
         pass
-    if start:
+    if start and "start" not in startup:
+        recordStartup("start")
         t.stop()
         t.deleteLater()
+        mw.removeEventFilter(startEvent)
         onWorkbench()
         accessoriesMenu()
         mw.mainWindowClosed.connect(onClose)
@@ -218,13 +520,18 @@ def onStart():
 
 
 def onClose():
-    """Remove system presets and groups without index on FreeCAD close."""
-    p.RemGroup("System")
+    """Save usage statistics, remove stale system presets and groups
+       without index on FreeCAD close."""
+    usage.save()
+    cp.collect()
 
     for wb in Gui.listWorkbenches():
-        base = p.GetGroup("User").GetGroup(wb)
-        if not cpc.splitIndex(base):
-            p.GetGroup("User").RemGroup(wb)
+        for source in ["User", "System"]:
+            base = p.GetGroup(source).GetGroup(wb)
+            if not cpc.splitIndex(base):
+                p.GetGroup(source).RemGroup(wb)
+
+    cpc.invalidateIndex()
 
 
 def onPreStart():
@@ -236,10 +543,36 @@ def onPreStart():
             onStart()
 
 
+class StartEvent(QtCore.QObject):
+    """Start as soon as FreeCAD sets the main window eventLoop property."""
+    def eventFilter(self, obj, event):
+        """Dynamic property change event."""
+        if (event.type() == QtCore.QEvent.DynamicPropertyChange and
+                event.propertyName().data() == b"eventLoop"):
+            if "eventLoop" not in startup:
+                recordStartup("eventLoop")
+            QtCore.QTimer.singleShot(0, onPreStart)
+        return QtCore.QObject.eventFilter(self, obj, event)
+
+
 setContainer()
-setLayout()
 
 
+timerUpdate = QtCore.QTimer()
+timerUpdate.setSingleShot(True)
+timerUpdate.timeout.connect(updatePanel)
+cpo.subscribe(onParameter)
+
+
+startEvent = StartEvent()
+mw.installEventFilter(startEvent)
+
+
+# Polling is only a fallback (and FreeCAD 0.16 start)
 t = QtCore.QTimer()
 t.timeout.connect(onPreStart)
-t.start(500)
+if App.Version()[1] < "17":
+    t.start(500)
+else:
+    t.start(max(p.GetInt("StartPollInterval", 2000), 100))
+QtCore.QTimer.singleShot(0, onPreStart)
@@ -0,0 +1,116 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Icon cache."""
+
+
+import os
+from collections import OrderedDict
+import FreeCADGui as Gui
+from PySide import QtGui
+from PySide import QtCore
+import CommandPanelCommon as cpc
+
+
+path = os.path.dirname(__file__) + "/Resources/icons/"
+icons = OrderedDict()
+counters = {"hits": 0, "misses": 0}
+# Maximum number of cached icons, read on first use (Common imports icons)
+size = None
+
+
+def refresh():
+    """Read the maximum number of cached icons and evict icons exceeding
+       it. Called again when the IconCacheSize parameter changes."""
+    global size
+    size = max(cpc.p.GetInt("IconCacheSize", 256), 1)
+    while len(icons) > size:
+        icons.popitem(last=False)
+
+
+def cached(key, factory):
+    """Return cached icon for the key. Icon is created by the factory
+       on cache miss and least recently used icons are evicted."""
+    icon = icons.pop(key, None)
+    if icon is None:
+        counters["misses"] += 1
+        icon = factory()
+    else:
+        counters["hits"] += 1
+    icons[key] = icon
+    if size is None:
+        refresh()
+    elif len(icons) > size:
+        icons.popitem(last=False)
+    return icon
+
+
+def icon(name):
+    """Icon from the file or resource name."""
+    return cached(name, lambda: QtGui.QIcon(name))
+
+
+def freecad():
+    """FreeCAD icon, used for commands without an icon."""
+    return icon(":/icons/freecad")
+
+
+def resource(name):
+    """Command panel icon from Resources/icons."""
+    return icon(path + name)
+
+
+def unavailable():
+    """Disabled FreeCAD icon, used for unavailable commands."""
+    def factory():
+        pixmap = freecad().pixmap(256, QtGui.QIcon.Disabled)
+        return QtGui.QIcon(pixmap)
+    return cached(":/icons/freecad:disabled", factory)
+
+
+def stats():
+    """Number of cached icons, cache hits and cache misses."""
+    result = dict(counters)
+    result["size"] = len(icons)
+    return result
+
+
+def invalidate():
+    """Remove all icons from the cache."""
+    icons.clear()
+
+
+class ThemeEvent(QtCore.QObject):
+    """Invalidate icon cache on style, palette or theme change."""
+    def eventFilter(self, obj, event):
+        """Style, palette and theme change events."""
+        if event.type() in themeEvents:
+            invalidate()
+        return QtCore.QObject.eventFilter(self, obj, event)
+
+
+themeEvents = [QtCore.QEvent.StyleChange, QtCore.QEvent.PaletteChange]
+try:
+    themeEvents.append(QtCore.QEvent.ThemeChange)
+except AttributeError:
+    pass
+
+
+themeEvent = ThemeEvent()
+Gui.getMainWindow().installEventFilter(themeEvent)
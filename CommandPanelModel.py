@@ -0,0 +1,154 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Command model."""
+
+
+from PySide import QtGui
+from PySide import QtCore
+import CommandPanelCommon as cpc
+import CommandPanelIcons as icons
+import CommandPanelSearch as search
+
+
+SearchRole = QtCore.Qt.UserRole + 1
+shared = None
+
+
+class Entry(object):
+    """Display data of the command. Icon is fetched on first use."""
+    __slots__ = ["name", "text", "toolTip", "key", "icon"]
+
+    def __init__(self, action):
+        self.name = action.objectName()
+        self.text = action.text().replace("&", "")
+        self.toolTip = action.toolTip()
+        self.key = self.text.lower()
+        self.icon = None
+
+
+class CommandModel(QtCore.QAbstractListModel):
+    """List model over the action registry."""
+    def __init__(self):
+        super(CommandModel, self).__init__()
+        self.names = []
+        self.entries = {}
+        self.generation = None
+
+    def refresh(self):
+        """Rebuild the model after the action registry changed."""
+        actions = cpc.actionList()
+        if self.generation == cpc.actionGeneration():
+            return
+        self.beginResetModel()
+        self.entries = {}
+        for name in actions:
+            self.entries[name] = Entry(actions[name])
+        self.names = list(self.entries)
+        self.generation = cpc.actionGeneration()
+        self.endResetModel()
+
+    def entry(self, name):
+        """Display data for the command name or None."""
+        try:
+            return self.entries[name]
+        except KeyError:
+            pass
+        actions = cpc.actionList()
+        if name in actions:
+            self.entries[name] = Entry(actions[name])
+            return self.entries[name]
+        return None
+
+    def icon(self, entry):
+        """Command icon, fetched from the action on first use."""
+        if entry.icon is None:
+            action = cpc.actionList().get(entry.name)
+            if action and not action.icon().isNull():
+                entry.icon = action.icon()
+            else:
+                entry.icon = icons.freecad()
+        return entry.icon
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.names)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.names):
+            return None
+        entry = self.entries[self.names[index.row()]]
+        if role == QtCore.Qt.DisplayRole:
+            return entry.text
+        elif role == QtCore.Qt.ToolTipRole:
+            return entry.toolTip
+        elif role == QtCore.Qt.DecorationRole:
+            return self.icon(entry)
+        elif role == QtCore.Qt.UserRole:
+            return entry.name
+        elif role == SearchRole:
+            return entry.key
+        else:
+            return None
+
+
+class CommandFilter(QtGui.QSortFilterProxyModel):
+    """Command list filtered by the search text. Commands are sorted
+       by menu text, or by search rank while searching."""
+    def __init__(self, parent=None):
+        super(CommandFilter, self).__init__(parent)
+        self.text = ""
+        self.ranks = None
+        self.setDynamicSortFilter(True)
+        self.setSortCaseSensitivity(QtCore.Qt.CaseInsensitive)
+
+    def setFilterText(self, text):
+        """Show commands matching the text."""
+        text = text.strip().lower()
+        if text == self.text:
+            return
+        self.text = text
+        if text:
+            matches = search.search(text)
+            self.ranks = dict(zip(matches, range(len(matches))))
+        else:
+            self.ranks = None
+        self.invalidate()
+
+    def filterAcceptsRow(self, row, parent):
+        if self.ranks is None:
+            return True
+        return self.sourceModel().names[row] in self.ranks
+
+    def lessThan(self, left, right):
+        if self.ranks is None:
+            return super(CommandFilter, self).lessThan(left, right)
+        names = self.sourceModel().names
+        return (self.ranks[names[left.row()]] <
+                self.ranks[names[right.row()]])
+
+
+def model():
+    """Shared command model."""
+    global shared
+    if shared is None:
+        shared = CommandModel()
+    shared.refresh()
+    return shared
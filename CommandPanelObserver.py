@@ -0,0 +1,135 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Parameter observers.
+
+Parameter changes in BaseApp/CommandPanel are turned into events and
+passed to the subscribers as subscriber(kind, source, workbench,
+domain, name). Event kinds:
+
+    setting     Setting in the CommandPanel group changed (name).
+    workbench   Default menu of the workbench changed.
+    menu        Menu group parameter changed (domain and name).
+    index       Menus of the workbench were added or removed."""
+
+
+import CommandPanelCommon as cpc
+
+
+p = cpc.p
+observed = False
+observers = {}
+subscribers = []
+
+
+def subscribe(subscriber):
+    """Add subscriber for parameter events."""
+    if subscriber not in subscribers:
+        subscribers.append(subscriber)
+
+
+def unsubscribe(subscriber):
+    """Remove subscriber for parameter events."""
+    if subscriber in subscribers:
+        subscribers.remove(subscriber)
+
+
+def notify(kind, source=None, workbench=None, domain=None, name=None):
+    """Pass the event to the subscribers."""
+    for subscriber in list(subscribers):
+        subscriber(kind, source, workbench, domain, name)
+
+
+class Observer(object):
+    """Parameter observer for one of the command panel groups."""
+    def __init__(self, source=None, workbench=None, slot=None):
+        self.source = source
+        self.workbench = workbench
+        self.slot = slot
+
+    def OnChange(self, grp, reason):
+        """Parameter changed."""
+        if self.source is None:
+            notify("setting", name=reason)
+        elif reason in ["index", "uuid"]:
+            # Groups created by newGroup are not in use yet
+            if not cpc.mutating:
+                cpc.invalidateIndex(self.source, self.workbench)
+                notify("index", self.source, self.workbench, name=reason)
+        elif self.slot is None:
+            if reason == "default":
+                notify("workbench", self.source, self.workbench, name=reason)
+        else:
+            domain = ".".join(["CPMenu",
+                               self.source,
+                               self.workbench,
+                               grp.GetString("uuid")])
+            notify("menu", self.source, self.workbench, domain, reason)
+
+
+def attach(grp, key):
+    """Attach observer to the parameter group once. Menu group keys
+       include the menu uuid, as groups are recreated on delete."""
+    global observed
+    if key in observers:
+        return
+    obs = Observer(*key[:3])
+    try:
+        grp.Attach(obs)
+    except AttributeError:
+        return
+    observers[key] = obs
+    observed = True
+
+
+def watch(workbench):
+    """Attach observers to the User and System groups of the workbench,
+       so default menu and index changes made outside the command panel
+       are noticed before the menus of the workbench are used."""
+    for source in ["User", "System"]:
+        attach(p.GetGroup(source).GetGroup(workbench),
+               (source, workbench, None))
+
+
+def onGroups(source, workbench, index):
+    """Attach observers to workbench base group and menu groups."""
+    base = p.GetGroup(source).GetGroup(workbench)
+    attach(base, (source, workbench, None))
+    for uid in index:
+        attach(base.GetGroup(index[uid]),
+               (source, workbench, index[uid], uid))
+
+
+def start():
+    """Attach observer to the settings group, existing workbench groups
+       and known menu groups."""
+    attach(p, (None, None, None))
+    cpc.groupHooks.append(onGroups)
+    for source in ["User", "System"]:
+        try:
+            workbenches = p.GetGroup(source).GetGroups()
+        except AttributeError:
+            workbenches = []
+        for wb in workbenches:
+            attach(p.GetGroup(source).GetGroup(wb), (source, wb, None))
+    for key in list(cpc.groupIndex):
+        onGroups(key[0], key[1], cpc.groupIndex[key])
+
+
+start()
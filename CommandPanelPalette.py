@@ -0,0 +1,140 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Command palette."""
+
+
+from PySide import QtGui
+from PySide import QtCore
+import CommandPanelCommon as cpc
+import CommandPanelIcons as icons
+import CommandPanelModel as cpm
+import CommandPanelSearch as search
+import CommandPanelCommands as cpcmd
+import CommandPanelUsage as usage
+
+
+def resultLimit():
+    """Maximum number of listed search results."""
+    return max(cpc.p.GetInt("PaletteResults", 30), 1)
+
+
+class Palette(QtGui.QWidget):
+    """Search field and result list for the invoke popup. Results are
+       navigated with up and down keys and triggered with enter."""
+
+    triggered = QtCore.Signal()
+    searching = QtCore.Signal(bool)
+
+    def __init__(self, parent=None):
+        super(Palette, self).__init__(parent)
+        self.edit = QtGui.QLineEdit()
+        self.edit.setPlaceholderText("Search commands")
+        self.frequent = QtGui.QToolButton()
+        self.frequent.setText("Frequent")
+        self.frequent.setToolTip("Most used commands")
+        self.frequent.setPopupMode(QtGui.QToolButton.InstantPopup)
+        self.frequent.setMenu(cpcmd.FrequentMenu(self.frequent))
+        self.frequent.menu().used.connect(self.onFrequent)
+        self.results = QtGui.QListWidget()
+        self.results.setUniformItemSizes(True)
+        self.results.hide()
+        layout = QtGui.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layoutEdit = QtGui.QHBoxLayout()
+        layoutEdit.addWidget(self.edit)
+        layoutEdit.addWidget(self.frequent)
+        layout.addLayout(layoutEdit)
+        layout.addWidget(self.results)
+        self.setLayout(layout)
+        self.edit.installEventFilter(self)
+        self.edit.textEdited.connect(self.onSearch)
+        self.edit.returnPressed.connect(self.onReturn)
+        self.results.itemActivated.connect(self.run)
+
+    def reset(self):
+        """Clear search and prebuild the index for the next search."""
+        self.edit.clear()
+        self.results.clear()
+        self.results.hide()
+        self.searching.emit(False)
+        self.edit.setFocus()
+        search.index()
+
+    def onSearch(self, text):
+        """List commands and menus matching the text."""
+        self.results.setUpdatesEnabled(False)
+        self.results.clear()
+        if text.strip():
+            model = cpm.model()
+            index = search.index()
+            for name in index.search(text, resultLimit()):
+                item = QtGui.QListWidgetItem(self.results)
+                item.setData(QtCore.Qt.UserRole, name)
+                entry = model.entry(name)
+                if entry:
+                    item.setText(entry.text)
+                    item.setToolTip(entry.toolTip)
+                    item.setIcon(model.icon(entry))
+                else:
+                    item.setText("Menu: " + index.text(name))
+                    item.setIcon(icons.resource("CommandPanelAddMenu.svg"))
+            self.results.setCurrentRow(0)
+        self.results.setVisible(self.results.count() > 0)
+        self.results.setUpdatesEnabled(True)
+        self.searching.emit(self.results.isVisibleTo(self))
+
+    def onReturn(self):
+        """Trigger the current result."""
+        item = self.results.currentItem()
+        if item and self.results.isVisible():
+            self.run(item)
+
+    def run(self, item):
+        """Trigger the command or show the menu."""
+        name = item.data(QtCore.Qt.UserRole)
+        self.triggered.emit()
+        if name.startswith("CPMenu"):
+            menu = cpcmd.CommandMenu(name)
+            menu.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+            menu.popup(QtGui.QCursor.pos())
+        else:
+            action = cpc.actionList().get(name)
+            if action and action.isEnabled():
+                usage.record(name)
+                action.trigger()
+
+    def onFrequent(self, action):
+        """Record command triggered from the frequent menu."""
+        usage.onTriggered(action)
+        self.triggered.emit()
+
+    def eventFilter(self, obj, event):
+        """Move the result selection with up and down keys."""
+        if (event.type() == QtCore.QEvent.KeyPress and
+                event.key() in [QtCore.Qt.Key_Up, QtCore.Qt.Key_Down] and
+                self.results.count()):
+            row = self.results.currentRow()
+            if event.key() == QtCore.Qt.Key_Up:
+                row = max(row - 1, 0)
+            else:
+                row = min(row + 1, self.results.count() - 1)
+            self.results.setCurrentRow(row)
+            return True
+        return super(Palette, self).eventFilter(obj, event)
@@ -0,0 +1,216 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Panel plan.
+
+Workbench configuration (default menu, global default menu and expanded
+menus) is compiled into an immutable plan of typed entries:
+
+    action      Command name.
+    separator   CPSeparator.
+    spacer      CPSpacer.
+    menu        Menu domain (CPMenu for the empty menu).
+    collapse    Collapse button of the expanded menu.
+
+Plans are memoized per workbench and layout and invalidated by
+parameter observer events. Dangling and self-referencing menu domains
+are reported as plan problems, logged once until the problems change."""
+
+
+from collections import namedtuple
+import FreeCAD as App
+import CommandPanelCommon as cpc
+import CommandPanelSettings as cps
+import CommandPanelObserver as cpo
+
+
+p = cpc.p
+plans = {}
+reported = {}
+globalDomain = "CPMenu.System.GlobalPanel.GlobalDefault"
+
+
+# Entry key is the command name used for panel buttons
+Entry = namedtuple("Entry", ["kind", "key", "domain"])
+Plan = namedtuple("Plan", ["workbench",
+                           "entries",
+                           "domains",
+                           "toolbars",
+                           "problems"])
+
+
+def entry(cmd):
+    """Typed entry for the command name."""
+    if cmd == "CPSeparator":
+        return Entry("separator", cmd, None)
+    elif cmd == "CPSpacer":
+        return Entry("spacer", cmd, None)
+    elif cmd == "CPMenu":
+        return Entry("menu", cmd, None)
+    elif cmd.startswith("CPMenu"):
+        return Entry("menu", cmd, cmd)
+    elif cmd.startswith("CPCollapse"):
+        return Entry("collapse", cmd, cmd.split("CPCollapse", 1)[1])
+    else:
+        return Entry("action", cmd, None)
+
+
+def defaultDomain(workbench):
+    """Default menu domain of the workbench and toolbar fallback flag."""
+    for source in ["User", "System"]:
+        domain = p.GetGroup(source).GetGroup(workbench).GetString("default")
+        if domain:
+            return domain, False
+    return globalDomain, True
+
+
+def expandMenu(domain, group, names, problems):
+    """Add command names of the expanded menu and the collapse button."""
+    for cmd in cpc.splitIndex(group, "commands"):
+        if cmd == domain:
+            problems.append(("self", domain, domain))
+        elif cmd.startswith("CPMenu") or cmd == "CPSeparator":
+            pass
+        else:
+            names.append(cmd)
+    # Move spacer after collapse button
+    if names and names[-1] == "CPSpacer":
+        names.insert(len(names) - 1, "CPCollapse" + domain)
+    else:
+        names.append("CPCollapse" + domain)
+
+
+def compilePlan(workbench):
+    """Compile workbench configuration into a plan."""
+    cpo.watch(workbench)
+    problems = []
+    domain, toolbars = defaultDomain(workbench)
+    domains = [domain]
+    commands = []
+    group = cpc.findGroup(domain)
+    if group:
+        commands = cpc.splitIndex(group, "commands")
+    elif not toolbars:
+        problems.append(("dangling", domain, workbench))
+    else:
+        pass
+
+    # Global default
+    temp = []
+    for cmd in commands:
+        if cmd == "CPGlobalDefault":
+            domains.append(globalDomain)
+            g = cpc.findGroup(globalDomain)
+            if g:
+                temp.extend(cpc.splitIndex(g, "commands"))
+            else:
+                problems.append(("dangling", globalDomain, domain))
+        elif cmd == domain:
+            problems.append(("self", domain, domain))
+        else:
+            temp.append(cmd)
+
+    # Expanded menus
+    names = []
+    for cmd in temp:
+        if cmd.startswith("CPMenu") and cmd != "CPMenu":
+            domains.append(cmd)
+            g = cpc.findGroup(cmd)
+            if not g:
+                problems.append(("dangling", cmd, domain))
+                names.append(cmd)
+            elif g.GetBool("Expand", False):
+                expandMenu(cmd, g, names, problems)
+            else:
+                names.append(cmd)
+        else:
+            names.append(cmd)
+
+    if cps.current().layout == "Grid":
+        names = [cmd for cmd in names if cmd != "CPSpacer"]
+
+    report(workbench, problems)
+
+    return Plan(workbench,
+                tuple([entry(cmd) for cmd in names]),
+                tuple(domains),
+                toolbars,
+                tuple(problems))
+
+
+def report(workbench, problems):
+    """Log plan problems, unless already logged for the workbench."""
+    if reported.get(workbench, []) == problems:
+        return
+    reported[workbench] = problems
+    for kind, name, referrer in problems:
+        if kind == "self":
+            App.Console.PrintWarning("Command panel: menu " + name +
+                                     " references itself\n")
+        else:
+            App.Console.PrintWarning("Command panel: menu " + name +
+                                     " used by " + referrer +
+                                     " does not exist\n")
+
+
+def resolve(workbench):
+    """Memoized plan of the workbench."""
+    key = (workbench, cps.current().layout)
+    try:
+        return plans[key]
+    except KeyError:
+        pass
+    result = compilePlan(workbench)
+    if cpo.observed:
+        plans[key] = result
+    return result
+
+
+def invalidate(workbench=None, domain=None, prefix=None):
+    """Remove plans for workbench, plans using the menu domain or plans
+       using any menu domain starting with prefix. Remove all plans if
+       no argument is provided."""
+    for key in list(plans):
+        domains = plans[key].domains
+        if workbench is None and domain is None and prefix is None:
+            del plans[key]
+        elif workbench and key[0] == workbench:
+            del plans[key]
+        elif domain and domain in domains:
+            del plans[key]
+        elif prefix and any(d.startswith(prefix) for d in domains):
+            del plans[key]
+        else:
+            pass
+
+
+def onParameter(kind, source, workbench, domain, name):
+    """Invalidate plans affected by the parameter change."""
+    if kind == "workbench":
+        invalidate(workbench=workbench)
+    elif kind == "menu" and name in ["commands", "Expand"]:
+        invalidate(domain=domain)
+    elif kind == "index":
+        invalidate(workbench=workbench,
+                   prefix=".".join(["CPMenu", source, workbench, ""]))
+    else:
+        pass
+
+
+cpo.subscribe(onParameter)
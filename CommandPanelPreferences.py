@@ -20,18 +20,20 @@
 """Command panel for FreeCAD - Preferences."""
 
 
-import os
 import FreeCADGui as Gui
 from PySide import QtGui
 from PySide import QtCore
 import CommandPanelGui as cpg
 import CommandPanelCommon as cpc
+import CommandPanelCache as cache
+import CommandPanelIcons as icons
+import CommandPanelModel as cpm
 import CommandPanelToolbars as cpt
+import CommandPanelTiming as timing
 
 
 p = cpc.p
 mw = Gui.getMainWindow()
-path = os.path.dirname(__file__) + "/Resources/icons/"
 
 cBoxWb = None
 cBoxMenu = None
@@ -71,7 +73,7 @@ def saveEnabled():
         g = cpc.findGroup(domain)
         if g:
             g.SetString("commands", ",".join(items))
-            cpg.onWorkbench()
+            cpg.scheduleUpdate()
 
 
 def dialog():
@@ -152,14 +154,17 @@ def general(dia, stack, btnClose, btnSettings):
     search = QtGui.QLineEdit()
 
     # Available commands
-    commands = QtGui.QListWidget()
-    commands.setSortingEnabled(True)
-    commands.sortItems(QtCore.Qt.AscendingOrder)
+    proxy = cpm.CommandFilter(w)
+    proxy.setSourceModel(cpm.model())
+    proxy.sort(0, QtCore.Qt.AscendingOrder)
+    commands = QtGui.QListView()
+    commands.setModel(proxy)
+    commands.setUniformItemSizes(True)
 
     # Reset workbench
     btnResetWb = QtGui.QPushButton()
     btnResetWb.setToolTip("Reset workbench to defaults")
-    btnResetWb.setIcon(QtGui.QIcon(path + "CommandPanelReset.svg"))
+    btnResetWb.setIcon(icons.resource("CommandPanelReset.svg"))
 
     # Checkbox default menu
     ckDefault = QtGui.QCheckBox()
@@ -168,65 +173,63 @@ def general(dia, stack, btnClose, btnSettings):
     # Button add workbench menu
     btnAddWbMenu = QtGui.QPushButton()
     btnAddWbMenu.setToolTip("Add new workbench menu")
-    btnAddWbMenu.setIcon(QtGui.QIcon(path + "CommandPanelAdd.svg"))
+    btnAddWbMenu.setIcon(icons.resource("CommandPanelAdd.svg"))
 
     # Button remove workbench menu
     btnRemoveWbMenu = QtGui.QPushButton()
     btnRemoveWbMenu.setToolTip("Remove selected workbench menu")
-    btnRemoveWbMenu.setIcon(QtGui.QIcon(path + "CommandPanelRemove.svg"))
+    btnRemoveWbMenu.setIcon(icons.resource("CommandPanelRemove.svg"))
 
     # Button copy workbench menu
     btnCopyWbMenu = QtGui.QPushButton()
     btnCopyWbMenu.setToolTip("Copy existing workbench menu")
-    btnCopyWbMenu.setIcon(QtGui.QIcon(path + "CommandPanelCopy.svg"))
+    btnCopyWbMenu.setIcon(icons.resource("CommandPanelCopy.svg"))
 
     # Button rename workbench menu
     btnRenameWbMenu = QtGui.QPushButton()
     btnRenameWbMenu.setToolTip("Rename selected workbench menu")
-    btnRenameWbMenu.setIcon(QtGui.QIcon(path + "CommandPanelRename.svg"))
+    btnRenameWbMenu.setIcon(icons.resource("CommandPanelRename.svg"))
 
     # Button add command
     btnAddCommand = QtGui.QPushButton()
     btnAddCommand.setToolTip("Add selected command")
-    btnAddCommand.setIcon(QtGui.QIcon(path + "CommandPanelAddCommand.svg"))
+    btnAddCommand.setIcon(icons.resource("CommandPanelAddCommand.svg"))
 
     # Button remove command
     btnRemoveCommand = QtGui.QPushButton()
     btnRemoveCommand.setToolTip("Remove selected command")
-    btnRemoveCommand.setIcon(QtGui.QIcon(path +
-                                         "CommandPanelRemoveCommand.svg"))
+    btnRemoveCommand.setIcon(icons.resource("CommandPanelRemoveCommand.svg"))
 
     # Button move up
     btnMoveUp = QtGui.QPushButton()
     btnMoveUp.setToolTip("Move selected command up")
-    btnMoveUp.setIcon(QtGui.QIcon(path + "CommandPanelUp.svg"))
+    btnMoveUp.setIcon(icons.resource("CommandPanelUp.svg"))
 
     # Button move down
     btnMoveDown = QtGui.QPushButton()
     btnMoveDown.setToolTip("Move selected command down")
-    btnMoveDown.setIcon(QtGui.QIcon(path + "CommandPanelDown.svg"))
+    btnMoveDown.setIcon(icons.resource("CommandPanelDown.svg"))
 
     # Button add separator
     btnAddSeparator = QtGui.QPushButton()
     btnAddSeparator.setToolTip("Add separator")
-    btnAddSeparator.setIcon(QtGui.QIcon(path +
-                                        "CommandPanelAddSeparator.svg"))
+    btnAddSeparator.setIcon(icons.resource("CommandPanelAddSeparator.svg"))
 
     # Button add spacer
     btnAddSpacer = QtGui.QPushButton()
     btnAddSpacer.setToolTip("Add spacer")
-    btnAddSpacer.setIcon(QtGui.QIcon(path + "CommandPanelAddSpacer.svg"))
+    btnAddSpacer.setIcon(icons.resource("CommandPanelAddSpacer.svg"))
 
     # Button add menu
     btnAddMenu = QtGui.QPushButton()
     btnAddMenu.setToolTip("Add menu")
-    btnAddMenu.setIcon(QtGui.QIcon(path + "CommandPanelAddMenu.svg"))
+    btnAddMenu.setIcon(icons.resource("CommandPanelAddMenu.svg"))
 
     # Button edit menu
     btnEditMenu = QtGui.QPushButton()
     btnEditMenu.setEnabled(False)
     btnEditMenu.setToolTip("Edit menu")
-    btnEditMenu.setIcon(QtGui.QIcon(path + "CommandPanelEditMenu.svg"))
+    btnEditMenu.setIcon(icons.resource("CommandPanelEditMenu.svg"))
 
     # Layout
     loPanels = QtGui.QHBoxLayout()
@@ -278,34 +281,20 @@ def general(dia, stack, btnClose, btnSettings):
 
     def onSearch(text):
         """Show or hide commands on search."""
-        for index in range(commands.count()):
-            if text.lower() in commands.item(index).text().lower():
-                commands.item(index).setHidden(False)
-            else:
-                commands.item(index).setHidden(True)
+        proxy.setFilterText(text)
 
     search.textEdited.connect(onSearch)
 
     def populateCommands():
         """Populate available commands panel."""
-        actions = cpc.actionList()
-        commands.blockSignals(True)
-        commands.clear()
-        for i in actions:
-            item = QtGui.QListWidgetItem(commands)
-            item.setText(actions[i].text().replace("&", ""))
-            item.setToolTip(actions[i].toolTip())
-            icon = actions[i].icon()
-            if icon.isNull():
-                item.setIcon(QtGui.QIcon(":/icons/freecad"))
-            else:
-                item.setIcon(icon)
-            item.setData(QtCore.Qt.UserRole, actions[i].objectName())
-        commands.setCurrentRow(0)
-        commands.blockSignals(False)
+        started = timing.start()
+        cpm.model()
+        commands.setCurrentIndex(proxy.index(0, 0))
+        timing.stop("populateCommands", started, "Preferences")
 
     def populateCBoxWb():
         """Workbench selector combo box."""
+        started = timing.start()
         wb = Gui.listWorkbenches()
         wbSort = list(wb)
         wbSort.sort()
@@ -316,13 +305,13 @@ def general(dia, stack, btnClose, btnSettings):
             try:
                 icon = cpc.wbIcon(wb[i].Icon)
             except AttributeError:
-                icon = QtGui.QIcon(":/icons/freecad")
+                icon = icons.freecad()
             mt = wb[i].MenuText
             cn = wb[i].__class__.__name__
             cBoxWb.insertItem(0, icon, mt, cn)
         cBoxWb.insertSeparator(0)
         cBoxWb.insertItem(0,
-                          QtGui.QIcon(":/icons/freecad"),
+                          icons.freecad(),
                           "Global panel",
                           "GlobalPanel")
         if p.GetBool("Global", 0):
@@ -331,6 +320,7 @@ def general(dia, stack, btnClose, btnSettings):
             activeWb = Gui.activeWorkbench().__class__.__name__
             cBoxWb.setCurrentIndex(cBoxWb.findData(activeWb))
         cBoxWb.blockSignals(False)
+        timing.stop("populateCBoxWb", started, "Preferences")
 
     def onCBoxWb():
         """Activate workbench on selection."""
@@ -353,6 +343,7 @@ def general(dia, stack, btnClose, btnSettings):
 
     def populateCBoxMenu():
         """Workbench menu combo box."""
+        started = timing.start()
         base = baseGroup()
         index = cpc.splitIndex(base)
         ckDefault.blockSignals(True)
@@ -377,6 +368,7 @@ def general(dia, stack, btnClose, btnSettings):
             ckDefault.setChecked(False)
         ckDefault.blockSignals(False)
         cBoxMenu.blockSignals(False)
+        timing.stop("populateCBoxMenu", started, "Preferences")
 
     def onCBoxMenu():
         """Load workbench menu data."""
@@ -397,6 +389,9 @@ def general(dia, stack, btnClose, btnSettings):
         """Reset workbench to defaults."""
         base = baseGroup()
         base.Clear()
+        wb = cBoxWb.itemData(cBoxWb.currentIndex())
+        cpc.invalidateIndex("User", wb)
+        cache.invalidate(workbench=wb)
         cpc.defaultGroup(base)
         populateCBoxMenu()
         domain = cBoxMenu.itemData(cBoxMenu.currentIndex())
@@ -480,7 +475,7 @@ def general(dia, stack, btnClose, btnSettings):
             base.SetString("default", domain)
         else:
             base.RemString("default")
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckDefault.stateChanged.connect(onCKDefault)
 
@@ -495,6 +490,7 @@ def general(dia, stack, btnClose, btnSettings):
 
     def populateEnabled(group):
         """Populate enabled commands panel."""
+        started = timing.start()
         if group:
             items = group.GetString("commands")
         else:
@@ -503,7 +499,7 @@ def general(dia, stack, btnClose, btnSettings):
             items = items.split(",")
         else:
             items = []
-        actions = cpc.actionList()
+        model = cpm.model()
         enabled.blockSignals(True)
         enabled.clear()
         for i in items:
@@ -511,12 +507,11 @@ def general(dia, stack, btnClose, btnSettings):
             if i == "CPSeparator":
                 item.setText("Separator")
                 item.setData(QtCore.Qt.UserRole, i)
-                item.setIcon(QtGui.QIcon(path +
-                                         "CommandPanelAddSeparator.svg"))
+                item.setIcon(icons.resource("CommandPanelAddSeparator.svg"))
             elif i == "CPSpacer":
                 item.setText("Spacer")
                 item.setData(QtCore.Qt.UserRole, i)
-                item.setIcon(QtGui.QIcon(path + "CommandPanelAddSpacer.svg"))
+                item.setIcon(icons.resource("CommandPanelAddSpacer.svg"))
             elif i.startswith("CPMenu"):
                 g = cpc.findGroup(i)
                 if g:
@@ -528,44 +523,42 @@ def general(dia, stack, btnClose, btnSettings):
                 else:
                     item.setText("Menu")
                 item.setData(QtCore.Qt.UserRole, i)
-                item.setIcon(QtGui.QIcon(path + "CommandPanelAddMenu.svg"))
-            elif i in actions:
-                item.setText(actions[i].text().replace("&", ""))
-                item.setToolTip(actions[i].toolTip())
-                icon = actions[i].icon()
-                if icon.isNull():
-                    item.setIcon(QtGui.QIcon(":/icons/freecad"))
-                else:
-                    item.setIcon(icon)
+                item.setIcon(icons.resource("CommandPanelAddMenu.svg"))
+            elif model.entry(i):
+                entry = model.entry(i)
+                item.setText(entry.text)
+                item.setToolTip(entry.toolTip)
+                item.setIcon(model.icon(entry))
                 item.setData(QtCore.Qt.UserRole, i)
             else:
                 item.setText(i)
                 item.setToolTip("Command " + i + " is not currently available")
-                icon = QtGui.QIcon()
-                icon.addPixmap(QtGui.QPixmap(":/icons/freecad"))
-                item.setIcon(QtGui.QIcon(icon.pixmap(256,
-                                                     QtGui.QIcon.Disabled)))
+                item.setIcon(icons.unavailable())
                 item.setData(QtCore.Qt.UserRole, i)
         enabled.setCurrentRow(0)
         enabled.blockSignals(False)
-        cpg.onWorkbench()
+        timing.stop("populateEnabled", started, "Preferences")
+        cpg.scheduleUpdate()
         onSelectionChanged()
 
     def onBtnAddCommand():
         """Add the selected command."""
+        current = commands.currentIndex()
+        if not current.isValid():
+            return
         row = enabled.currentRow()
-        data = commands.currentItem().data(QtCore.Qt.UserRole)
+        data = current.data(QtCore.Qt.UserRole)
         item = QtGui.QListWidgetItem()
         enabled.insertItem(row + 1, item)
         enabled.setCurrentRow(row + 1)
-        item.setText(commands.currentItem().text().replace("&", ""))
-        item.setToolTip(commands.currentItem().toolTip())
-        item.setIcon(commands.currentItem().icon())
+        item.setText(current.data(QtCore.Qt.DisplayRole))
+        item.setToolTip(current.data(QtCore.Qt.ToolTipRole))
+        item.setIcon(current.data(QtCore.Qt.DecorationRole))
         item.setData(QtCore.Qt.UserRole, data)
         saveEnabled()
 
     btnAddCommand.clicked.connect(onBtnAddCommand)
-    commands.itemDoubleClicked.connect(onBtnAddCommand)
+    commands.doubleClicked.connect(onBtnAddCommand)
 
     def onBtnRemoveCommand():
         """Remove the selected command."""
@@ -611,7 +604,7 @@ def general(dia, stack, btnClose, btnSettings):
         enabled.setCurrentRow(row + 1)
         item.setText("Separator")
         item.setData(QtCore.Qt.UserRole, "CPSeparator")
-        item.setIcon(QtGui.QIcon(path + "CommandPanelAddSeparator.svg"))
+        item.setIcon(icons.resource("CommandPanelAddSeparator.svg"))
         saveEnabled()
 
     btnAddSeparator.clicked.connect(onBtnAddSeparator)
@@ -624,7 +617,7 @@ def general(dia, stack, btnClose, btnSettings):
         enabled.setCurrentRow(row + 1)
         item.setText("Spacer")
         item.setData(QtCore.Qt.UserRole, "CPSpacer")
-        item.setIcon(QtGui.QIcon(path + "CommandPanelAddSpacer.svg"))
+        item.setIcon(icons.resource("CommandPanelAddSpacer.svg"))
         saveEnabled()
 
     btnAddSpacer.clicked.connect(onBtnAddSpacer)
@@ -637,7 +630,7 @@ def general(dia, stack, btnClose, btnSettings):
         enabled.setCurrentRow(row + 1)
         item.setText("Menu")
         item.setData(QtCore.Qt.UserRole, "CPMenu")
-        item.setIcon(QtGui.QIcon(path + "CommandPanelAddMenu.svg"))
+        item.setIcon(icons.resource("CommandPanelAddMenu.svg"))
         saveEnabled()
         onSelectionChanged()
 
@@ -742,6 +735,7 @@ def edit(stack):
 
     def updateTree():
         """Update tree widget and add available menus."""
+        started = timing.start()
         tree.blockSignals = True
         wb = Gui.listWorkbenches()
         currentWb = cBoxWb.itemData(cBoxWb.currentIndex())
@@ -761,9 +755,9 @@ def edit(stack):
                 try:
                     icon = cpc.wbIcon(wb[currentWb].Icon)
                 except AttributeError:
-                    icon = QtGui.QIcon(":/icons/freecad")
+                    icon = icons.freecad()
             else:
-                icon = QtGui.QIcon(":/icons/freecad")
+                icon = icons.freecad()
 
             if not mt:
                 mt = wb[currentWb].MenuText
@@ -867,6 +861,7 @@ def edit(stack):
                             parent = parent.parent()
 
         tree.blockSignals = False
+        timing.stop("updateTree", started, "Preferences")
 
     def onChecked(item):
         """Copy or set menu."""
@@ -980,6 +975,34 @@ def settings(stack, btnSettingsDone):
     loGlobal.addWidget(ckBoxGlobal)
     loMode.insertLayout(0, loGlobal)
 
+    # Cached panels
+    loCache = QtGui.QHBoxLayout()
+    lblCache = QtGui.QLabel("Cached panels")
+    cacheSpin = QtGui.QSpinBox()
+    cacheSpin.setToolTip("Number of workbench panels kept in memory")
+    cacheSpin.setRange(1, 100)
+    cacheSpin.setValue(cache.cacheSize())
+
+    loCache.addWidget(lblCache)
+    loCache.addStretch()
+    loCache.addWidget(cacheSpin)
+    loMode.insertLayout(1, loCache)
+
+    # Virtualized panel
+    loVirtual = QtGui.QHBoxLayout()
+    lblVirtual = QtGui.QLabel("Virtualize large panels")
+    ckBoxVirtual = QtGui.QCheckBox()
+    ckBoxVirtual.setToolTip("Create only visible buttons for panels with "
+                            "many buttons")
+
+    loVirtual.addWidget(lblVirtual)
+    loVirtual.addStretch()
+    loVirtual.addWidget(ckBoxVirtual)
+    loMode.insertLayout(2, loVirtual)
+
+    if p.GetBool("Virtual", 0):
+        ckBoxVirtual.setChecked(True)
+
     if p.GetBool("Global", 0):
         ckBoxGlobal.setChecked(True)
 
@@ -990,10 +1013,27 @@ def settings(stack, btnSettingsDone):
         else:
             p.SetBool("Global", 0)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxGlobal.stateChanged.connect(onCkBoxGlobal)
 
+    def onCacheSpin(n):
+        """Set number of cached panels."""
+        p.SetInt("CacheSize", n)
+
+    cacheSpin.valueChanged.connect(onCacheSpin)
+
+    def onCkBoxVirtual(checked):
+        """Set virtualized panel mode."""
+        if checked:
+            p.SetBool("Virtual", 1)
+        else:
+            p.SetBool("Virtual", 0)
+
+        cpg.scheduleUpdate()
+
+    ckBoxVirtual.stateChanged.connect(onCkBoxVirtual)
+
     # Layout (buttons)
     loLayout = QtGui.QVBoxLayout()
     grpBoxLayout = QtGui.QGroupBox("Layout:")
@@ -1031,8 +1071,7 @@ def settings(stack, btnSettingsDone):
                 if i.isChecked():
                     p.SetString("Layout", i.objectName())
 
-            cpg.setLayout()
-            cpg.onWorkbench()
+            cpg.scheduleUpdate()
 
     rLoFlow.toggled.connect(onGrpBoxLayout)
     rLoGrid.toggled.connect(onGrpBoxLayout)
@@ -1040,7 +1079,7 @@ def settings(stack, btnSettingsDone):
     def onColumnSpin(n):
         """Set number of columns."""
         p.SetInt("ColumnNumber", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     columnSpin.valueChanged.connect(onColumnSpin)
 
@@ -1083,7 +1122,7 @@ def settings(stack, btnSettingsDone):
                 if i.isChecked():
                     p.SetString("Style", i.objectName())
 
-            cpg.onWorkbench()
+            cpg.scheduleUpdate()
 
     rBtnIcon.toggled.connect(onGrpBoxStyle)
     rBtnText.toggled.connect(onGrpBoxStyle)
@@ -1104,7 +1143,7 @@ def settings(stack, btnSettingsDone):
         else:
             p.SetBool("AutoRaise", 0)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxBtnRaise.stateChanged.connect(onCkBoxBtnRaise)
 
@@ -1209,14 +1248,14 @@ def settings(stack, btnSettingsDone):
             p.SetBool("EnableIconSize", 0)
             iconSpin.setEnabled(False)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxIconSize.stateChanged.connect(onCkBoxIconSize)
 
     def onIconSize(n):
         """Set button icon size."""
         p.SetInt("IconSize", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     iconSpin.valueChanged.connect(onIconSize)
 
@@ -1230,14 +1269,14 @@ def settings(stack, btnSettingsDone):
             p.SetBool("EnableFontSize", 0)
             txtSpin.setEnabled(False)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxTxtSize.stateChanged.connect(onCkBoxTxtSize)
 
     def onTxtSize(n):
         """Set button font size."""
         p.SetInt("FontSize", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     txtSpin.valueChanged.connect(onTxtSize)
 
@@ -1251,14 +1290,14 @@ def settings(stack, btnSettingsDone):
             p.SetBool("EnableButtonWidth", 0)
             btnWidthSpin.setEnabled(False)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxBtnWidth.stateChanged.connect(onCkBoxBtnWidth)
 
     def onButtonWidth(n):
         """Set button width size."""
         p.SetInt("ButtonWidth", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     btnWidthSpin.valueChanged.connect(onButtonWidth)
 
@@ -1272,14 +1311,14 @@ def settings(stack, btnSettingsDone):
             p.SetBool("EnableButtonHeight", 0)
             btnHeightSpin.setEnabled(False)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxBtnHeight.stateChanged.connect(onCkBoxBtnHeight)
 
     def onButtonHeight(n):
         """Set button height size."""
         p.SetInt("ButtonHeight", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     btnHeightSpin.valueChanged.connect(onButtonHeight)
 
@@ -1293,14 +1332,14 @@ def settings(stack, btnSettingsDone):
             p.SetBool("EnableButtonSpacing", 0)
             btnSpacingSpin.setEnabled(False)
 
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     ckBoxBtnSpacing.stateChanged.connect(onCkBoxBtnSpacing)
 
     def onButtonSpacing(n):
         """Set buttons spacing value."""
         p.SetInt("ButtonSpacing", n)
-        cpg.onWorkbench()
+        cpg.scheduleUpdate()
 
     btnSpacingSpin.valueChanged.connect(onButtonSpacing)
 
@@ -1374,6 +1413,7 @@ def settings(stack, btnSettingsDone):
             menuHeightSpin.setEnabled(False)
 
         cpg.setContainer()
+        cpg.scheduleUpdate()
 
     ckBoxMenuEnable.stateChanged.connect(onCkBoxMenuEnable)
 
@@ -0,0 +1,241 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Command search.
+
+Commands are matched against the command name, menu text, tooltip, the
+toolbars the command was found in and the workbench owning the toolbar.
+Menus (CPMenu domains) of the workbenches used so far are matched by
+menu name and workbench. Matches are ordered by category, then by
+usage, then by length of the menu text (of the fuzzy match):
+
+    prefix      Menu text or command name starts with the query.
+    word        Word in the menu text starts with the query.
+    substring   Menu text or command name contains the query.
+    context     Tooltip or toolbar contains the query.
+    fuzzy       Query characters appear in order in the menu text or
+                command name."""
+
+
+import re
+from PySide import QtGui
+import FreeCADGui as Gui
+import CommandPanelCommon as cpc
+import CommandPanelObserver as cpo
+import CommandPanelUsage as usage
+
+
+p = cpc.p
+mw = Gui.getMainWindow()
+shared = None
+stale = False
+
+PREFIX = 400
+WORD = 300
+SUBSTRING = 200
+CONTEXT = 100
+FUZZY = 0
+# Usage counts above the limit are treated as equal
+USAGE = 50
+
+
+def toolbarContext(context):
+    """Add titles of the current toolbars and the workbench owning the
+       visible toolbars to the command context."""
+    try:
+        workbench = Gui.activeWorkbench().MenuText.lower()
+    except AttributeError:
+        workbench = None
+    for tb in mw.findChildren(QtGui.QToolBar):
+        titles = [tb.windowTitle().lower()]
+        if workbench and tb.toggleViewAction().isVisible():
+            titles.append(workbench)
+        actions = list(tb.actions())
+        for btn in tb.findChildren(QtGui.QToolButton):
+            if btn.menu():
+                actions.extend(btn.menu().actions())
+        for a in actions:
+            if a.objectName():
+                context.setdefault(a.objectName(), set()).update(titles)
+
+
+class Index(object):
+    """Search index over the action registry. Lowercase search fields
+       are stored in lists sharing the row number."""
+    def __init__(self):
+        self.generation = None
+        self.context = {}
+        self.names = []
+        self.texts = []
+        self.keys = []
+        self.titles = []
+        self.extras = []
+        self.positions = {}
+        self.query = None
+        self.candidates = None
+
+    def refresh(self):
+        """Rebuild the index after the action registry changed. Toolbar
+           context is collected from all workbenches used so far."""
+        global stale
+        actions = cpc.actionList()
+        if self.generation == cpc.actionGeneration() and not stale:
+            return
+        stale = False
+        toolbarContext(self.context)
+        self.names = []
+        self.texts = []
+        self.keys = []
+        self.titles = []
+        self.extras = []
+        for name in actions:
+            text = actions[name].text().replace("&", "")
+            self.names.append(name)
+            self.texts.append(text)
+            self.keys.append(name.lower())
+            self.titles.append(text.lower())
+            self.extras.append(" ".join([actions[name].toolTip().lower()] +
+                                        sorted(self.context.get(name, []))))
+        for domain, text, workbench in menus():
+            self.names.append(domain)
+            self.texts.append(text)
+            self.keys.append(text.lower())
+            self.titles.append(text.lower())
+            self.extras.append("menu " + workbench.lower())
+        self.positions = dict(zip(self.names, range(len(self.names))))
+        self.generation = cpc.actionGeneration()
+        self.query = None
+        self.candidates = None
+
+    def text(self, name):
+        """Display text of the command or menu."""
+        return self.texts[self.positions[name]]
+
+    def rows(self, query):
+        """Rows to score. Results of the previous query are narrowed,
+           when the query was extended."""
+        if (self.candidates is not None and
+                self.query and
+                query.startswith(self.query)):
+            return self.candidates
+        return range(len(self.names))
+
+    def score(self, query):
+        """Category and length of the matching rows as {row: (category,
+           length)}."""
+        fuzzy = re.compile(".*?".join([re.escape(c) for c in query]))
+        word = " " + query
+        titles = self.titles
+        keys = self.keys
+        extras = self.extras
+        result = {}
+        for row in self.rows(query):
+            title = titles[row]
+            key = keys[row]
+            if title.startswith(query) or key.startswith(query):
+                result[row] = (PREFIX, len(title))
+            elif word in title:
+                result[row] = (WORD, len(title))
+            elif query in title or query in key:
+                result[row] = (SUBSTRING, len(title))
+            elif query in extras[row]:
+                result[row] = (CONTEXT, len(title))
+            else:
+                m = fuzzy.search(title) or fuzzy.search(key)
+                if m:
+                    result[row] = (FUZZY, m.end() - m.start())
+        self.query = query
+        self.candidates = sorted(result)
+        return result
+
+    def search(self, query, limit=None):
+        """Command names matching the query, best matches first."""
+        self.refresh()
+        query = query.strip().lower()
+        if not query:
+            self.query = None
+            self.candidates = None
+            return list(self.names)
+        result = self.score(query)
+        usage.load()
+        counts = usage.counts
+        names = self.names
+        titles = self.titles
+
+        def order(r):
+            category, length = result[r]
+            used = min(counts.get(names[r], 0), USAGE)
+            return (-category, -used, length, titles[r])
+
+        rows = sorted(result, key=order)
+        if limit:
+            rows = rows[:limit]
+        return [names[r] for r in rows]
+
+
+def menus():
+    """Domain, name and workbench of the menus of all workbenches."""
+    result = []
+    for source in ["User", "System"]:
+        try:
+            workbenches = p.GetGroup(source).GetGroups()
+        except AttributeError:
+            workbenches = []
+        for workbench in workbenches:
+            base = p.GetGroup(source).GetGroup(workbench)
+            index = cpc.domainIndex(source, workbench)
+            for uid in index:
+                name = base.GetGroup(index[uid]).GetString("name")
+                try:
+                    name = name.decode("UTF-8")
+                except AttributeError:
+                    pass
+                domain = ".".join(["CPMenu", source, workbench, uid])
+                result.append((domain, name, workbench))
+    return result
+
+
+def invalidate(*args):
+    """Rebuild the index on next search."""
+    global stale
+    stale = True
+
+
+def onParameter(kind, source, workbench, domain, name):
+    """Rebuild the index after menus were added, removed or renamed."""
+    if kind == "index" or (kind == "menu" and name == "name"):
+        invalidate()
+
+
+def index():
+    """Shared search index."""
+    global shared
+    if shared is None:
+        shared = Index()
+    shared.refresh()
+    return shared
+
+
+def search(query, limit=None):
+    """Command names matching the query, best matches first."""
+    return index().search(query, limit)
+
+
+cpc.groupHooks.append(invalidate)
+cpo.subscribe(onParameter)
@@ -0,0 +1,121 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Settings."""
+
+
+from collections import namedtuple
+import CommandPanelCommon as cpc
+import CommandPanelObserver as cpo
+
+
+p = cpc.p
+snapshot = None
+
+
+Settings = namedtuple("Settings", [
+    "globalPanel",
+    "layout",
+    "columns",
+    "spacing",
+    "style",
+    "autoRaise",
+    "iconSize",
+    "fontSize",
+    "buttonWidth",
+    "buttonHeight",
+    "menu",
+    "menuWidth",
+    "menuHeight",
+    "virtual",
+    "virtualThreshold"])
+
+
+# Parameters used by the settings snapshot
+names = [
+    "Global",
+    "Layout",
+    "ColumnNumber",
+    "ButtonSpacing",
+    "Style",
+    "AutoRaise",
+    "EnableIconSize",
+    "IconSize",
+    "EnableFontSize",
+    "FontSize",
+    "EnableButtonWidth",
+    "ButtonWidth",
+    "EnableButtonHeight",
+    "ButtonHeight",
+    "Menu",
+    "MenuWidth",
+    "MenuHeight",
+    "Virtual",
+    "VirtualThreshold"]
+
+
+def enabledInt(enable, name, default):
+    """Integer parameter value or None if the setting is disabled."""
+    if p.GetBool(enable, 0):
+        return p.GetInt(name, default)
+    return None
+
+
+def load():
+    """Read settings from the parameter group."""
+    return Settings(
+        globalPanel=p.GetBool("Global", 0),
+        layout=p.GetString("Layout"),
+        columns=p.GetInt("ColumnNumber", 1),
+        spacing=p.GetInt("ButtonSpacing", 5),
+        style=p.GetString("Style"),
+        autoRaise=p.GetBool("AutoRaise", 1),
+        iconSize=enabledInt("EnableIconSize", "IconSize", 16),
+        fontSize=enabledInt("EnableFontSize", "FontSize", 8),
+        buttonWidth=enabledInt("EnableButtonWidth", "ButtonWidth", 30),
+        buttonHeight=enabledInt("EnableButtonHeight", "ButtonHeight", 30),
+        menu=p.GetBool("Menu", 0),
+        menuWidth=p.GetInt("MenuWidth", 300),
+        menuHeight=p.GetInt("MenuHeight", 300),
+        virtual=p.GetBool("Virtual", 0),
+        virtualThreshold=p.GetInt("VirtualThreshold", 200))
+
+
+def current():
+    """Current settings snapshot. Snapshot is loaded once and
+       refreshed after settings parameters change."""
+    global snapshot
+    if snapshot is None or not cpo.observed:
+        snapshot = load()
+    return snapshot
+
+
+def invalidate():
+    """Load the settings snapshot again on next request."""
+    global snapshot
+    snapshot = None
+
+
+def onParameter(kind, source, workbench, domain, name):
+    """Invalidate the snapshot on settings change."""
+    if kind == "setting" and name in names:
+        invalidate()
+
+
+cpo.subscribe(onParameter)
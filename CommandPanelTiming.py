@@ -0,0 +1,131 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Phase timing.
+
+Panel rebuild and preferences populate phases are timed when the Stats
+parameter is enabled. Phase times are aggregated per workbench into
+histograms (count, total, minimum, maximum and bucket counts). Phases
+of the preferences dialog are aggregated as workbench Preferences.
+Menu groups used by the panel plan are timed as part of the plan and
+the grid layout pass is done by Qt and not timed.
+
+    update              Panel update on workbench activation.
+    plan                Workbench commands from the panel plan.
+    actionList          Action registry lookup.
+    findGroup           Menu group lookup of panel buttons and menus.
+    defaultAction       Default action of the menu.
+    buttonFactory       Button creation.
+    menuButton          Menu of the menu button.
+    buttons             All panel buttons.
+    refresh             Update of the cached panel.
+    layoutButtons       Buttons added to the panel layout.
+    layout              Flow layout and virtualized panel geometry pass.
+    populateCommands    Preferences available commands.
+    populateCBoxWb      Preferences workbench selector.
+    populateCBoxMenu    Preferences menu selector.
+    populateEnabled     Preferences enabled commands.
+    updateTree          Preferences menu tree."""
+
+
+import time
+import CommandPanelCommon as cpc
+import CommandPanelObserver as cpo
+
+
+p = cpc.p
+enabled = False
+workbench = None
+histograms = {}
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    clock = time.time
+
+# Upper bucket bounds in milliseconds, last bucket is unbounded
+BUCKETS = [0.01, 0.1, 1, 10, 100, 1000]
+
+
+def refresh():
+    """Read the enable flag."""
+    global enabled
+    enabled = p.GetBool("Stats", 0)
+
+
+def start():
+    """Start time of the phase, or None if timing is disabled."""
+    if enabled:
+        return clock()
+    return None
+
+
+def stop(phase, started, wb=None):
+    """Record the phase time. Current workbench is used by default."""
+    if started is None:
+        return
+    record(phase, (clock() - started) * 1000, wb or workbench)
+
+
+def record(phase, ms, wb):
+    """Add the phase time in milliseconds to the histogram."""
+    phases = histograms.setdefault(wb, {})
+    h = phases.get(phase)
+    if h is None:
+        h = phases[phase] = {"count": 0,
+                             "total": 0.0,
+                             "min": ms,
+                             "max": ms,
+                             "buckets": [0] * (len(BUCKETS) + 1)}
+    h["count"] += 1
+    h["total"] += ms
+    h["min"] = min(h["min"], ms)
+    h["max"] = max(h["max"], ms)
+    i = 0
+    while i < len(BUCKETS) and ms > BUCKETS[i]:
+        i += 1
+    h["buckets"][i] += 1
+
+
+def stats():
+    """Copy of the histograms as {workbench: {phase: histogram}}."""
+    result = {}
+    for wb in histograms:
+        result[wb] = {}
+        for phase in histograms[wb]:
+            h = dict(histograms[wb][phase])
+            h["buckets"] = list(zip(BUCKETS + [None], h["buckets"]))
+            h["mean"] = h["total"] / h["count"]
+            result[wb][phase] = h
+    return result
+
+
+def reset():
+    """Remove recorded phase times."""
+    histograms.clear()
+
+
+def onParameter(kind, source, workbench, domain, name):
+    """Enable or disable timing."""
+    if kind == "setting" and name == "Stats":
+        refresh()
+
+
+refresh()
+cpo.subscribe(onParameter)
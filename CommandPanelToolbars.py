@@ -21,15 +21,74 @@
 
 
 from PySide import QtGui
+from PySide import QtCore
 import FreeCADGui as Gui
 import CommandPanelCommon as cpc
 
 
 mw = Gui.getMainWindow()
+toolbarList = None
+# Commands per toolbar set, for the action registry generation
+commandCache = {}
+commandGeneration = None
+
+
+def invalidateToolbars():
+    """Find workbench toolbars again on next request."""
+    global toolbarList
+    toolbarList = None
+
+
+def invalidateCommands():
+    """Extract commands from toolbars again on next request."""
+    commandCache.clear()
+
+
+class ToolbarEvent(QtCore.QObject):
+    """Invalidate cached toolbars when toolbars are added, removed,
+       shown or hidden and cached commands when actions of toolbars or
+       toolbar button menus change. A menu replaced on a toolbar button
+       is noticed on the next toolbar or registry change."""
+    def eventFilter(self, obj, event):
+        """Main window child, toolbar and menu events."""
+        t = event.type()
+        if obj is mw:
+            if t in [QtCore.QEvent.ChildAdded, QtCore.QEvent.ChildRemoved]:
+                invalidateToolbars()
+        elif t in [QtCore.QEvent.Show, QtCore.QEvent.Hide]:
+            if isinstance(obj, QtGui.QToolBar):
+                invalidateToolbars()
+        elif t in [QtCore.QEvent.ActionAdded, QtCore.QEvent.ActionRemoved]:
+            invalidateCommands()
+        else:
+            pass
+        return QtCore.QObject.eventFilter(self, obj, event)
+
+
+toolbarEvent = ToolbarEvent()
+mw.installEventFilter(toolbarEvent)
+
+
+def watch(tb):
+    """Install toolbar event filter once."""
+    if not tb.property("CommandPanelWatched"):
+        tb.setProperty("CommandPanelWatched", True)
+        tb.installEventFilter(toolbarEvent)
+        tb.toggleViewAction().changed.connect(invalidateToolbars)
+
+
+def watchMenu(menu):
+    """Install toolbar event filter on toolbar button menu once."""
+    if not menu.property("CommandPanelWatched"):
+        menu.setProperty("CommandPanelWatched", True)
+        menu.installEventFilter(toolbarEvent)
 
 
 def getToolbars():
     "Workbench toolbars."
+    global toolbarList
+    if toolbarList is not None:
+        return toolbarList
 
     exclude = [
         "File",
@@ -40,9 +99,11 @@ def getToolbars():
 
     toolbars = []
     for tb in mw.findChildren(QtGui.QToolBar):
+        watch(tb)
         if (tb.toggleViewAction().isVisible() and
                 tb.objectName() not in exclude):
             toolbars.append(tb)
+    toolbarList = toolbars
     return toolbars
 
 
@@ -55,21 +116,36 @@ def menuCommands(menu, actions, commands):
 
 
 def toolbarCommands(name=None):
-    "Extract commands from toolbars."
-    commands = []
+    "Extract commands from toolbars. Result is cached per toolbar set."
+    global commandGeneration
     actions = cpc.actionList()
+    if commandGeneration != cpc.actionGeneration():
+        commandGeneration = cpc.actionGeneration()
+        commandCache.clear()
     if name:
         toolbars = [mw.findChild(QtGui.QToolBar, name)]
+        toolbars = [tb for tb in toolbars if tb]
+        for tb in toolbars:
+            watch(tb)
     else:
         toolbars = getToolbars()
 
+    key = tuple([tb.objectName() for tb in toolbars])
+    try:
+        return list(commandCache[key])
+    except KeyError:
+        pass
+
+    commands = []
     for tb in toolbars:
         for btn in tb.findChildren(QtGui.QToolButton):
             if btn.menu():
+                watchMenu(btn.menu())
                 menuCommands(btn.menu(), actions, commands)
             elif (btn.defaultAction() and
                   btn.defaultAction().objectName() in actions):
                 commands.append(btn.defaultAction().objectName())
             else:
                 pass
+    commandCache[key] = tuple(commands)
     return commands
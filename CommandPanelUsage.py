@@ -0,0 +1,121 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Command usage statistics.
+
+Usage is collected in memory and saved to BaseApp/CommandPanel/Usage
+after a quiet period and on FreeCAD close. Entries are stored in a
+single string as name;count;time separated by comma."""
+
+
+import time
+from PySide import QtCore
+import CommandPanelCommon as cpc
+
+
+p = cpc.p
+counts = {}
+last = {}
+loaded = False
+dirty = False
+
+
+def load():
+    """Load saved usage statistics once."""
+    global loaded
+    if loaded:
+        return
+    loaded = True
+    for entry in cpc.splitIndex(p.GetGroup("Usage"), "data"):
+        try:
+            name, count, stamp = entry.rsplit(";", 2)
+            counts[name] = counts.get(name, 0) + int(count)
+            last[name] = max(last.get(name, 0), float(stamp))
+        except ValueError:
+            pass
+
+
+def save():
+    """Save usage statistics if changed."""
+    global dirty
+    timerSave.stop()
+    if not dirty:
+        return
+    dirty = False
+    load()
+    data = []
+    for name in counts:
+        data.append(";".join([name, str(counts[name]), str(last[name])]))
+    p.GetGroup("Usage").SetString("data", ",".join(data))
+
+
+def record(name):
+    """Count the command use. Saving is deferred."""
+    global dirty
+    if not name:
+        return
+    counts[name] = counts.get(name, 0) + 1
+    last[name] = time.time()
+    dirty = True
+    if not timerSave.isActive():
+        timerSave.start(max(p.GetInt("UsageSaveDelay", 10000), 0))
+
+
+def onTriggered(action):
+    """Record action triggered from the command panel."""
+    record(action.objectName())
+
+
+def count(name):
+    """Number of command uses."""
+    load()
+    return counts.get(name, 0)
+
+
+def lastUsed(name):
+    """Time of the last command use or 0."""
+    load()
+    return last.get(name, 0)
+
+
+def frequent(names=None, limit=None):
+    """Used command names, most used and most recently used first."""
+    load()
+    if names is None:
+        names = counts
+    result = [n for n in names if n in counts]
+    result.sort(key=lambda n: (-counts[n], -last[n]))
+    if limit:
+        result = result[:limit]
+    return result
+
+
+def clear():
+    """Remove usage statistics."""
+    global dirty
+    load()
+    counts.clear()
+    last.clear()
+    dirty = True
+    save()
+
+
+timerSave = QtCore.QTimer()
+timerSave.setSingleShot(True)
+timerSave.timeout.connect(save)
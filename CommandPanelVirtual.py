@@ -0,0 +1,258 @@
+# Command panel for FreeCAD
+# Copyright (C) 2015, 2016 (as part of TabBar) triplus @ FreeCAD
+# Copyright (C) 2017, 2018, 2019 triplus @ FreeCAD
+#
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301 USA
+
+"""Command panel for FreeCAD - Virtualized panel."""
+
+
+import bisect
+from PySide import QtGui
+from PySide import QtCore
+import CommandPanelCommon as cpc
+import CommandPanelIcons as icons
+import CommandPanelSettings as cps
+import CommandPanelCommands as cpcmd
+import CommandPanelFlowLayout as flow
+import CommandPanelTiming as timing
+
+
+def isVirtual(count):
+    """Check if panel with count buttons should be virtualized."""
+    s = cps.current()
+    return s.virtual and count >= s.virtualThreshold
+
+
+def isCommand(entry):
+    """Check if plan entry is a plain command."""
+    return entry.kind == "action"
+
+
+def gridRects(metrics, width, columns, space):
+    """Item rectangles (x, y, width, height) and total height for
+       grid layout of item metrics (width, height, spacer)."""
+    rects = []
+    columns = max(columns, 1)
+    cell = max((width - (columns - 1) * space) // columns, 0)
+    y = 0
+    for i in range(0, len(metrics), columns):
+        row = metrics[i:i + columns]
+        height = max([m[1] for m in row])
+        for x in range(len(row)):
+            rects.append((x * (cell + space), y, cell, height))
+        y += height + space
+    return rects, max(y - space, 0)
+
+
+class VirtualArea(QtGui.QWidget):
+    """Panel area with buttons materialized only when they intersect
+       the scroll area viewport (plus one viewport height of margin).
+       Geometry is computed from cached button metrics and plain
+       command buttons are recycled while scrolling."""
+    def __init__(self, scroll, commands):
+        super(VirtualArea, self).__init__()
+        policy = self.sizePolicy()
+        policy.setHeightForWidth(True)
+        self.setSizePolicy(policy)
+        self.scroll = scroll
+        self.probe = cpcmd.buttonFactory()
+        self.probe.setParent(self)
+        self.probe.hide()
+        self.keys = []
+        self.metrics = {}
+        self.heights = {}
+        self.rects = []
+        self.rowTops = []
+        self.rowBottoms = []
+        self.rowFirst = []
+        self.geometryWidth = None
+        self.active = {}
+        self.pool = []
+        self.buttons = []
+        self.menus = []
+        scroll.verticalScrollBar().valueChanged.connect(self.updateVisible)
+        self.setKeys(commands)
+
+    def keyMetrics(self, key, actions):
+        """Size hint and spacer flag for the plan entry."""
+        try:
+            return self.metrics[key]
+        except KeyError:
+            pass
+        m = None
+        if isCommand(key) and key.key in actions:
+            self.probe.setDefaultAction(actions[key.key])
+            if self.probe.icon().isNull():
+                self.probe.setIcon(icons.freecad())
+            hint = self.probe.sizeHint()
+            self.probe.removeAction(actions[key.key])
+            m = (hint.width(), hint.height(), False)
+        elif not isCommand(key):
+            btn = cpcmd.commandButton(key, actions)
+            if btn and btn.objectName() == "CPSpacer":
+                m = (0, 0, True)
+            elif btn:
+                btn.setParent(self)
+                btn.hide()
+                hint = btn.sizeHint()
+                m = (hint.width(), hint.height(), False)
+            else:
+                pass
+            if btn:
+                self.discard(btn)
+        else:
+            pass
+        self.metrics[key] = m
+        return m
+
+    def setKeys(self, commands):
+        """Set panel plan entries and materialize visible buttons."""
+        for i in list(self.active):
+            self.recycle(i)
+        self.metrics = {}
+        actions = cpc.actionList()
+        self.keys = [k for k in commands if self.keyMetrics(k, actions)]
+        self.heights = {}
+        self.geometryWidth = None
+        self.computeGeometry(self.width())
+        self.updateGeometry()
+        self.updateVisible()
+
+    def layoutRects(self, width):
+        """Compute item rectangles for the width."""
+        metrics = [self.metrics[k] for k in self.keys]
+        s = cps.current()
+        if s.layout == "Grid":
+            return gridRects(metrics, width, s.columns, s.spacing)
+        return flow.flowRects(metrics,
+                              QtCore.QRect(0, 0, width, 0),
+                              s.spacing)
+
+    def computeGeometry(self, width):
+        """Compute item rectangles and rows for the widget width."""
+        if width == self.geometryWidth:
+            return
+        started = timing.start()
+        self.geometryWidth = width
+        self.rects, height = self.layoutRects(width)
+        self.heights[width] = height
+        self.rowTops = []
+        self.rowBottoms = []
+        self.rowFirst = []
+        for i, r in enumerate(self.rects):
+            if not self.rowTops or r[1] != self.rowTops[-1]:
+                self.rowTops.append(r[1])
+                self.rowBottoms.append(r[1] + r[3])
+                self.rowFirst.append(i)
+            else:
+                self.rowBottoms[-1] = max(self.rowBottoms[-1], r[1] + r[3])
+        timing.stop("layout", started)
+
+    def visibleIndices(self, top, bottom):
+        """Indices of items intersecting the vertical range."""
+        first = bisect.bisect_left(self.rowBottoms, top)
+        last = bisect.bisect_right(self.rowTops, bottom)
+        if first >= last:
+            return range(0)
+        if last < len(self.rowFirst):
+            end = self.rowFirst[last]
+        else:
+            end = len(self.rects)
+        return range(self.rowFirst[first], end)
+
+    def recycle(self, i):
+        """Hide button and keep plain command buttons for reuse."""
+        btn = self.active.pop(i)
+        btn.hide()
+        if isCommand(btn.entry):
+            self.pool.append(btn)
+        else:
+            self.discard(btn)
+
+    def discard(self, btn):
+        """Delete button and its menu."""
+        if btn.menu():
+            btn.menu().deleteLater()
+        btn.deleteLater()
+
+    def materialize(self, i, actions):
+        """Create or reuse button for the item."""
+        key = self.keys[i]
+        if isCommand(key) and self.pool:
+            btn = self.pool.pop()
+            btn.entry = key
+            btn.key = key.key
+            if not cpcmd.refreshButton(btn, actions):
+                self.pool.append(btn)
+                return
+        else:
+            btn = cpcmd.commandButton(key, actions)
+            if not btn:
+                return
+            btn.setParent(self)
+        btn.setGeometry(QtCore.QRect(*self.rects[i]))
+        btn.show()
+        self.active[i] = btn
+
+    def updateVisible(self, *args):
+        """Materialize buttons intersecting the viewport."""
+        if not self.isVisible() or not self.rects:
+            return
+        viewport = self.scroll.viewport()
+        top = self.mapFrom(viewport, QtCore.QPoint(0, 0)).y()
+        margin = viewport.height()
+        visible = self.visibleIndices(top - margin,
+                                      top + viewport.height() + margin)
+        for i in list(self.active):
+            if i not in visible:
+                self.recycle(i)
+        actions = None
+        for i in visible:
+            if i not in self.active:
+                if actions is None:
+                    actions = cpc.actionList()
+                self.materialize(i, actions)
+        self.buttons[:] = [self.active[i] for i in sorted(self.active)]
+        self.menus[:] = cpcmd.panelMenus(self.buttons)
+
+    def hasHeightForWidth(self):
+        return True
+
+    def heightForWidth(self, width):
+        try:
+            return self.heights[width]
+        except KeyError:
+            height = self.layoutRects(width)[1]
+            self.heights[width] = height
+            return height
+
+    def sizeHint(self):
+        return QtCore.QSize(self.width(), self.heightForWidth(self.width()))
+
+    def minimumSizeHint(self):
+        return QtCore.QSize(0, 0)
+
+    def resizeEvent(self, event):
+        self.computeGeometry(event.size().width())
+        for i, btn in self.active.items():
+            btn.setGeometry(QtCore.QRect(*self.rects[i]))
+        self.updateVisible()
+        super(VirtualArea, self).resizeEvent(event)
+
+    def showEvent(self, event):
+        super(VirtualArea, self).showEvent(event)
+        self.updateVisible()